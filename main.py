@@ -1,20 +1,37 @@
 import functions_framework
 import requests
 import json
+from collections import OrderedDict
 import hashlib
 import io
-import simplekml # For KML generation
-from shapely.geometry import Point, mapping, shape
-from shapely.ops import cascaded_union, transform
-from shapely import wkt
+import gzip
+import zipfile
+import base64
+import time
+import threading
+import os
+import struct
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import resource
+import ijson
+from xml.sax.saxutils import escape as xml_escape # For KML generation
+import numpy as np
+import shapely
+from shapely.geometry import GeometryCollection, MultiPolygon, Polygon, box, mapping, shape
+from shapely.ops import unary_union
+from shapely import STRtree
 from google.cloud import storage
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from pyproj import CRS, Transformer
 import math
 # Imports for Google Drive
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
-from flask import jsonify
+from flask import Response, jsonify
 
 # ======================================================================
 # --- CONSTANTS ---
@@ -24,14 +41,108 @@ from flask import jsonify
 WASTEWATER_API_URL = "https://astikalimata.ypeka.gr/api/query/wastewatertreatmentplants"
 GCS_BUCKET_NAME = "mpelas-wastewater-bucket"
 PERIFEREIES_GEOJSON_PATH = "perifereiesWGS84.geojson"
-LAST_HASH_FILE_PATH = "wastewater_data_hash.txt"
+LAST_HASH_FILE_PATH = "wastewater_data_hash.txt"  # Hash and ETag/Last-Modified of the last processed payload
+PLANT_MANIFEST_PATH = "wastewater_plant_manifest.json"  # Per-plant fingerprints, stored next to the hash
+API_STREAM_CHUNK_SIZE = 64 * 1024
 OUTPUT_GEOJSON_PATH = "no_swim_zones/wastewater_no_swim_zones.geojson"
+ZONE_GRID_PATH = "no_swim_zones/wastewater_no_swim_zones_grid.npz"  # Lookup grid built from the zones
+ZONES_SIDECAR_PATH = "no_swim_zones/wastewater_no_swim_zones_wkb.npz"  # WKB + columnar properties twin of the GeoJSON
 BUFFER_DISTANCE_METERS = 200
 
+# Coarse masks for the coastal pre-filter in calculate_new_zones, derived from the
+# land mask: simplified, then shrunk (inland core) or grown (coastal band) by the
+# buffer distance plus these tolerances.
+COARSE_MASK_SIMPLIFY_METERS = 100
+COARSE_MASK_MARGIN_METERS = 50
+
+# Plant fields that affect a zone's geometry or its output properties
+ZONE_FINGERPRINT_FIELDS = (
+    'code', 'name', 'receiverName', 'receiverNameEn', 'receiverWaterType',
+    'latitude', 'longitude', 'receiverLocation', 'is_compliant',
+    'administrativeRegionId', 'administrativeRegion'
+)
+
+# Precomputed, tiled land mask (WKB), keyed by the content hash of PERIFEREIES_GEOJSON_PATH,
+# the tile size and every parameter the coarse masks are derived from
+LAND_MASK_CACHE_VERSION = 2  # Bump when LandMask.to_wkb's layout changes
+LAND_MASK_CACHE_PATH_TEMPLATE = (
+    "land_mask/land_mask_v{version}_{source_hash}_tiles{max_vertices}"
+    "_coarse{buffer_meters}-{simplify_meters}-{margin_meters}.wkb"
+)
+LAND_MASK_TILE_MAX_VERTICES = 256
+LAND_MASK_SEAM_TOLERANCE_DEGREES = 1e-9  # A seam vertex this close to its neighbours' line is dropped
+
+# Shared GCS client: size of the pooled HTTP transport
+GCS_HTTP_POOL_SIZE = 16
+
+# Worker threads check_for_changes uses to overlap independent I/O stages
+CHECK_STAGE_WORKERS = 4
+
+# Text artifacts are stored gzip-encoded (Content-Encoding: gzip); GCS decompresses
+# them on the fly for clients that don't accept gzip
+GCS_GZIP_LEVEL = 6
+
 # Constants for the KML/Drive Sync (sync_to_drive logic)
 GEOJSON_PATH = OUTPUT_GEOJSON_PATH # Same file path
 DRIVE_FOLDER_ID = "122jxF5nlwH8Re3ixoCjf2TuHyNCDuuxD"
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
+DRIVE_EXPORT_FORMAT = "kml"  # "kml", or "kmz" for a zipped export (uploaded as a separate Drive file)
+DRIVE_EXPORT_BASENAME = "wastewater_no_swim_zones"
+DRIVE_SYNC_STATE_PATH = "wastewater_drive_sync.json"  # GeoJSON generation and KML md5 last published to Drive
+DRIVE_EXPORT_BY_REGION = False  # One KMZ per administrative region, plus a master KML of NetworkLinks to them
+DRIVE_UPLOAD_WORKERS = 4        # Concurrent Drive uploads when publishing per region
+KML_MIMETYPE = 'application/vnd.google-earth.kml+xml'
+KMZ_MIMETYPE = 'application/vnd.google-earth.kmz'
+KML_COORDINATE_DECIMALS = 6  # ~0.1 m, well below the 200 m buffer
+# Rendered Placemarks are cached by content (geometry WKB + the properties they show) and the
+# cache is snapshotted to GCS, so an export only renders zones it hasn't seen before
+KML_FRAGMENT_CACHE_PATH = "kml_fragments/placemark_cache.json"
+KML_FRAGMENT_CACHE_MAX_CHARS = 32 * 1024 * 1024
+KML_FRAGMENT_CACHE_VERSION = 1  # Bump when _kml_placemark's output changes
+KML_FRAGMENT_FIELDS = ('location', 'Column1.compliance', 'details', 'name', 'code', 'receiverName')
+DRIVE_EXPORT_TILED = False   # Export a KMZ quadtree of Region/Lod-gated tiles instead of one flat document
+KML_TILE_MAX_LEVEL = 6
+KML_TILE_MAX_FEATURES = 32      # A tile with at most this many zones is a leaf (full geometry)
+KML_TILE_PIXELS = 256           # Inner tiles are simplified to (tile width / this)
+KML_TILE_MIN_LOD_PIXELS = 128   # A tile shows once its region covers this many pixels...
+# ...and an inner tile hands over to its children beyond this. A child region is half as wide,
+# so it reaches KML_TILE_MIN_LOD_PIXELS exactly here and the two levels never draw together
+KML_TILE_MAX_LOD_PIXELS = 2 * KML_TILE_MIN_LOD_PIXELS
+
+# Shared KML styles, referenced by every Placemark (colors are aabbggrr)
+KML_STYLES = {
+    'compliant': {'poly_color': '96ff0000', 'line_color': 'ffffffff', 'line_width': 2},      # Semi-transparent blue
+    'non_compliant': {'poly_color': 'ff0000ff', 'line_color': 'ffffffff', 'line_width': 2}   # Red
+}
+
+# Vector tile (MVT) pyramid of the zones for the web map, published next to the GeoJSON
+MVT_TILE_PATH_TEMPLATE = "no_swim_zones/tiles/{z}/{x}/{y}.pbf"
+MVT_MANIFEST_PATH = "no_swim_zones/tiles/manifest.json"  # Per-tile MD5s of the published pyramid
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+MVT_LAYER_NAME = "no_swim_zones"
+MVT_PROPERTIES = (
+    'code', 'name', 'receiverName', 'receiverNameEn', 'Column1.compliance',
+    'administrativeRegionId', 'administrativeRegion'
+)
+MVT_MIN_ZOOM = 6
+MVT_MAX_ZOOM = 14
+MVT_EXTENT = 4096                    # Tile coordinate resolution
+MVT_BUFFER = 64                      # Tile units of geometry kept beyond each edge, so outlines don't seam
+MVT_SIMPLIFY_UNITS = 1.0             # Simplification tolerance, in tile units of the zoom level
+MVT_TILES_PER_TASK = 256
+MVT_PROCESS_POOL_MIN_TILES = 2000    # Smaller pyramids are encoded in-process (worker start-up costs more)
+MVT_WORKERS = os.cpu_count() or 1
+MVT_UPLOAD_WORKERS = GCS_HTTP_POOL_SIZE
+
+# Constants for the swim zone query endpoints
+ZONE_INDEX_POLL_SECONDS = 60         # How often a warm instance checks for newly published zones
+ZONE_GRID_CELL_DEGREES = 0.0005      # Lookup grid resolution (~50 m), well below a zone's 400 m width
+LOOKUP_CACHE_PRECISION = 5           # Decimal places kept when quantizing query coordinates (~1 m)
+LOOKUP_CACHE_MAX_ENTRIES = 20000
+LOOKUP_CACHE_TTL_SECONDS = 3600
+BATCH_MAX_POINTS = 100000            # Largest batch accepted by check_swim_zones_batch
+BATCH_STREAM_THRESHOLD = 5000        # Batches above this size get a streamed response
+BATCH_STREAM_CHUNK_SIZE = 2000       # Results per streamed chunk
 
 # Define coordinate reference systems
 WGS84_CRS = CRS("EPSG:4326")        # Standard GPS coordinates (Degrees)
@@ -40,57 +151,518 @@ GREEK_GRID_CRS = CRS("EPSG:2100")  # Greek Grid for accurate meters (Meters)
 # Create transformers (always_xy=True ensures correct (lon, lat) or (east, north) order)
 transformer_to_greek_grid = Transformer.from_crs(WGS84_CRS, GREEK_GRID_CRS, always_xy=True).transform
 transformer_to_wgs84 = Transformer.from_crs(GREEK_GRID_CRS, WGS84_CRS, always_xy=True).transform
+transformer_to_web_mercator = Transformer.from_crs(WGS84_CRS, CRS("EPSG:3857"), always_xy=True).transform
+WEB_MERCATOR_WORLD_SIZE = 2 * math.pi * 6378137  # Width of the Web Mercator plane, in meters
+
+# In-process caches, reused across warm invocations of the same instance
+_GCS_CLIENT_CACHE = {}
+_GCS_CLIENT_LOCK = threading.Lock()
+_LAND_MASK_CACHE = {}
+_ZONE_INDEX_CACHE = {}
+_ZONE_INDEX_LOAD_LOCK = threading.Lock()
+_ZONE_INDEX_REFRESH_LOCK = threading.Lock()
+_DRIVE_SERVICE_POOL = []
+_DRIVE_FILE_CACHE = {}
+_DRIVE_LOCK = threading.Lock()
 
 # ======================================================================
 # --- HELPER FUNCTIONS (GCS/Geospatial) ---
 # ======================================================================
 
+def _log_gcs_call(response, *args, **kwargs):
+    """Session hook: logs the round-trip time of every GCS HTTP call."""
+    print(f"GCS {response.request.method} {response.status_code} "
+          f"in {response.elapsed.total_seconds() * 1000:.1f} ms")
+
+def get_storage_client():
+    """
+    Returns the module-wide storage client. It is created on first use, with credential
+    discovery done once and a pooled HTTP session, and reused across warm invocations.
+    """
+    if 'client' not in _GCS_CLIENT_CACHE:
+        with _GCS_CLIENT_LOCK:
+            if 'client' not in _GCS_CLIENT_CACHE:
+                started = time.perf_counter()
+                credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+                session = AuthorizedSession(credentials)
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=GCS_HTTP_POOL_SIZE, pool_maxsize=GCS_HTTP_POOL_SIZE
+                )
+                session.mount('https://', adapter)
+                session.hooks['response'].append(_log_gcs_call)
+                _GCS_CLIENT_CACHE['buckets'] = {}
+                _GCS_CLIENT_CACHE['client'] = storage.Client(project=project, credentials=credentials, _http=session)
+                print(f"GCS client initialized in {time.perf_counter() - started:.3f}s")
+    return _GCS_CLIENT_CACHE['client']
+
+def get_gcs_bucket(bucket_name):
+    """Returns a cached bucket handle on the shared storage client."""
+    storage_client = get_storage_client()
+    buckets = _GCS_CLIENT_CACHE['buckets']
+    if bucket_name not in buckets:
+        buckets[bucket_name] = storage_client.bucket(bucket_name)
+    return buckets[bucket_name]
+
 def get_gcs_blob(bucket_name, blob_name):
     """Retrieves a blob from Google Cloud Storage."""
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    return bucket.blob(blob_name)
+    return get_gcs_bucket(bucket_name).blob(blob_name)
+
+def upload_gzipped(blob, data, content_type):
+    """Uploads text/bytes to a blob gzip-encoded, logging the size reduction and upload time."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    started = time.perf_counter()
+    compressed = gzip.compress(data, compresslevel=GCS_GZIP_LEVEL)
+    compress_seconds = time.perf_counter() - started
+
+    blob.content_encoding = 'gzip'
+    started = time.perf_counter()
+    blob.upload_from_string(compressed, content_type=content_type)
+    print(
+        f"Uploaded {blob.name}: "
+        f"{len(data)} -> {len(compressed)} bytes gzip ({len(compressed) / max(len(data), 1):.1%}), "
+        f"compressed in {compress_seconds:.3f}s, uploaded in {time.perf_counter() - started:.3f}s"
+    )
+
+def _peak_rss_mib():
+    """Peak resident memory of this process so far, in MiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class _HashingReader:
+    """
+    Minimal file-like wrapper over an iterator of byte chunks, for feeding a streaming
+    response to ijson. Every byte that passes through is added to a SHA-256 digest.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def _fill(self, size):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return
+            self.digest.update(chunk)
+            self.size += len(chunk)
+            self._buffer += chunk
+
+    def first_significant_byte(self):
+        """Returns the first non-whitespace byte without consuming anything."""
+        while True:
+            stripped = self._buffer.lstrip()
+            if stripped:
+                return stripped[:1]
+            before = len(self._buffer)
+            self._fill(before + 1)
+            if len(self._buffer) == before:
+                return b''
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def fetch_wastewater_data(validators):
+    """
+    Fetches the wastewater API payload, conditionally when `validators` are given.
+    Returns (data, content_hash, new_validators); data is None when the server answers
+    304 Not Modified, in which case content_hash is the one stored with the validators.
+    The body is parsed incrementally into the list of plant records and hashed over
+    its raw bytes as they stream in; the full text is never held in memory.
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    started = time.perf_counter()
+    with requests.get(WASTEWATER_API_URL, headers=headers, timeout=30, stream=True) as response:
+        if response.status_code == 304:
+            print(f"API payload not modified (304) in {time.perf_counter() - started:.3f}s")
+            return None, validators['content_hash'], validators
+        response.raise_for_status()
+
+        reader = _HashingReader(response.iter_content(chunk_size=API_STREAM_CHUNK_SIZE))
+        # The payload is either a bare list of plants or a FeatureCollection-like object
+        prefix = 'item' if reader.first_significant_byte() == b'[' else 'features.item'
+        wastewater_data = list(ijson.items(reader, prefix, use_float=True))
+        reader.read()  # Hash whatever trails the parsed records
+        new_validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': reader.digest.hexdigest()
+        }
+
+    print(f"Fetched and parsed API payload ({reader.size} bytes, {len(wastewater_data)} records) "
+          f"in {time.perf_counter() - started:.3f}s, peak RSS {_peak_rss_mib():.1f} MiB")
+    return wastewater_data, new_validators['content_hash'], new_validators
 
 def load_perifereies_data(bucket_name, file_path):
     """Loads and parses the large perifereies GeoJSON file from GCS."""
     try:
+        peak_before = _peak_rss_mib()
         blob = get_gcs_blob(bucket_name, file_path)
-        geojson_data = blob.download_as_text()
-        perifereies_features = json.loads(geojson_data)
-        perifereies_geometries = [
-            shape(f['geometry']) for f in perifereies_features.get('features', [])
-        ]
+        # Stream the blob and turn each feature's geometry into a shapely object as
+        # soon as it is parsed, so neither the full text nor the dict tree is kept
+        with blob.open('rb') as stream:
+            perifereies_geometries = [
+                shape(geometry)
+                for geometry in ijson.items(stream, 'features.item.geometry', use_float=True)
+            ]
         print("====DIABASA tis perifereies perifereiesWGS84.geojson")
+        print(f"Peak RSS {peak_before:.1f} MiB -> {_peak_rss_mib():.1f} MiB while loading perifereies")
         # print(perifereies_geometries) # Commented out for cleaner logs
         return perifereies_geometries
     except Exception as e:
         print(f"Error loading perifereies GeoJSON: {e}")
         return None
 
-def calculate_new_zones(perifereies_geometries, wastewater_data):
+def subdivide_polygon(polygon, max_vertices):
+    """
+    Splits a polygon into pieces of at most `max_vertices` vertices by halving its
+    bounding box along the longer side until every piece is small enough.
+    """
+    pieces = []
+    pending = [polygon]
+    while pending:
+        geometry = pending.pop()
+        if shapely.get_num_coordinates(geometry) <= max_vertices:
+            pieces.append(geometry)
+            continue
+        minx, miny, maxx, maxy = geometry.bounds
+        if maxx - minx >= maxy - miny:
+            mid = (minx + maxx) / 2
+            halves = (box(minx, miny, mid, maxy), box(mid, miny, maxx, maxy))
+        else:
+            mid = (miny + maxy) / 2
+            halves = (box(minx, miny, maxx, mid), box(minx, mid, maxx, maxy))
+        for half in halves:
+            for piece in shapely.get_parts(geometry.intersection(half)):
+                if piece.geom_type == 'Polygon' and not piece.is_empty:
+                    pending.append(piece)
+    return pieces
+
+def build_coarse_masks(polygons):
+    """
+    Returns (inland_core, coastal_band) in EPSG:2100 for the unified land polygons.
+    A buffer around any point inside the inland core lies fully on land; one around
+    any point outside the coastal band lies fully at sea.
+    """
+    polygons_greek_grid = shapely.transform(
+        np.asarray(polygons, dtype=object), _bulk_transform(transformer_to_greek_grid)
+    )
+    simplified = shapely.simplify(polygons_greek_grid, COARSE_MASK_SIMPLIFY_METERS)
+    # Simplification moves the boundary by at most its tolerance, so offsetting
+    # by buffer + tolerance + margin keeps both masks on the safe side of the coast
+    offset = BUFFER_DISTANCE_METERS + COARSE_MASK_SIMPLIFY_METERS + COARSE_MASK_MARGIN_METERS
+    inland_core = shapely.union_all(shapely.buffer(simplified, -offset))
+    coastal_band = shapely.union_all(shapely.buffer(simplified, offset))
+    return inland_core, coastal_band
+
+class LandMask:
+    """
+    Spatial index over the unified perifereies polygons, pre-split into small tiles.
+
+    Built once per run. Every buffer is clipped only against the handful of tiles
+    its envelope actually touches, so the cost follows the local coastline detail
+    instead of the vertex count of a whole region.
+    """
+
+    def __init__(self, tiles, coarse_masks, seam_vertices):
+        self.parts = list(tiles)
+        self.source_hash = None  # Content hash of the perifereies file it was built from
+        self.coarse_masks = coarse_masks
+        # Vertices the tiling added (as sorted complex x + iy), so they can be dropped again
+        self.seam_vertices = np.sort(np.asarray(seam_vertices, dtype=complex))
+        for geometry in (*self.parts, *self.coarse_masks):
+            shapely.prepare(geometry)
+        self.tree = STRtree(self.parts)
+
+        # A tiny polygon outside the mask's extent. Differencing against it runs
+        # the same overlay GEOS runs against a disjoint mask (which re-seeds the
+        # ring start vertex), so the "fully at sea" fast path stays byte-identical
+        # to the old output at the cost of a 5-vertex clip.
+        minx, miny, _, _ = shapely.total_bounds(self.parts)
+        self._sea_probe = box(minx - 2, miny - 2, minx - 1, miny - 1)
+
+    @classmethod
+    def from_geometries(cls, perifereies_geometries):
+        """Unifies the raw perifereies geometries, then tiles and indexes the result."""
+        started = time.perf_counter()
+        unified = unary_union(perifereies_geometries)
+        polygons = list(getattr(unified, 'geoms', [unified]))
+        coarse_masks = build_coarse_masks(polygons)
+        tiles = [
+            tile for polygon in polygons
+            for tile in subdivide_polygon(polygon, LAND_MASK_TILE_MAX_VERTICES)
+        ]
+        source_coords = shapely.get_coordinates(polygons)
+        tile_coords = shapely.get_coordinates(tiles)
+        seam_vertices = np.setdiff1d(
+            tile_coords[:, 0] + 1j * tile_coords[:, 1], source_coords[:, 0] + 1j * source_coords[:, 1]
+        )
+        print(f"Tiled land mask: {len(polygons)} polygons -> {len(tiles)} tiles "
+              f"(max {LAND_MASK_TILE_MAX_VERTICES} vertices, {len(seam_vertices)} seam vertices) "
+              f"in {time.perf_counter() - started:.3f}s")
+        return cls(tiles, coarse_masks, seam_vertices)
+
+    @classmethod
+    def from_wkb(cls, data):
+        """Restores a land mask serialized with `to_wkb`."""
+        tiles, inland_core, coastal_band, seam_points = shapely.from_wkb(data).geoms
+        seam_coords = shapely.get_coordinates(seam_points)
+        return cls(tiles.geoms, (inland_core, coastal_band), seam_coords[:, 0] + 1j * seam_coords[:, 1])
+
+    def to_wkb(self):
+        """
+        Serializes the land mask as WKB: a GeometryCollection of the tiles (as one
+        MultiPolygon), the inland core, the coastal band and the seam vertices (as one MultiPoint).
+        """
+        seam_points = shapely.multipoints(np.column_stack((self.seam_vertices.real, self.seam_vertices.imag)))
+        return shapely.to_wkb(GeometryCollection([MultiPolygon(self.parts), *self.coarse_masks, seam_points]))
+
+    def _drop_seam_vertices(self, ring):
+        """
+        Returns the ring's coordinates without the seam vertices that lie on the line between
+        their neighbours, i.e. the ones that split a source edge where two tiles met.
+        """
+        coords = shapely.get_coordinates(ring)
+        vertices = coords[:-1]
+        is_seam = np.isin(vertices[:, 0] + 1j * vertices[:, 1], self.seam_vertices)
+        if not is_seam.any():
+            return coords
+        previous = np.roll(vertices, 1, axis=0)
+        following = np.roll(vertices, -1, axis=0)
+        chord = following - previous
+        offset = np.abs(chord[:, 0] * (vertices[:, 1] - previous[:, 1]) - chord[:, 1] * (vertices[:, 0] - previous[:, 0]))
+        on_chord = offset <= LAND_MASK_SEAM_TOLERANCE_DEGREES * np.hypot(chord[:, 0], chord[:, 1])
+        kept = vertices[~(is_seam & on_chord)]
+        if len(kept) < 3:
+            return coords
+        return np.vstack((kept, kept[:1]))
+
+    def dissolve(self, tiles):
+        """
+        Unions adjacent tiles back into one clip geometry. The seam vertices along the coast
+        are dropped, so every coastline edge is the source edge again and the difference
+        computes the same intersection points as it does against the untiled mask.
+        """
+        return shapely.multipolygons([
+            Polygon(self._drop_seam_vertices(polygon.exterior), [self._drop_seam_vertices(r) for r in polygon.interiors])
+            for polygon in shapely.get_parts(shapely.union_all(tiles))
+        ])
+
+    def clip_at_sea(self, geometries):
+        """Clip for geometries known to be fully at sea (see `_sea_probe`)."""
+        return shapely.difference(geometries, self._sea_probe)
+
+    def clip_many(self, geometries):
+        """
+        Vectorized clip: returns an array with the part of each geometry that is not on land.
+        Geometries fully on land come back as empty polygons.
+        """
+        started = time.perf_counter()
+        geometries = np.asarray(geometries, dtype=object)
+        tiles = np.asarray(self.parts, dtype=object)
+
+        # Candidate tiles per geometry: envelope hits confirmed against the prepared tiles
+        input_idx, tile_idx = self.tree.query(geometries)
+        touching = shapely.intersects(tiles[tile_idx], geometries[input_idx])
+        input_idx, tile_idx = input_idx[touching], tile_idx[touching]
+
+        # Fast path: geometries fully inside a single tile
+        on_land = np.zeros(len(geometries), dtype=bool)
+        on_land[input_idx[shapely.contains(tiles[tile_idx], geometries[input_idx])]] = True
+
+        # Fast path: geometries with no candidate lie fully at sea (see clip_at_sea).
+        # Tiles share edges, so several candidates are dissolved before the difference.
+        clip_geometries = np.full(len(geometries), self._sea_probe, dtype=object)
+        if len(input_idx):
+            group_starts = np.flatnonzero(np.diff(input_idx, prepend=-1))
+            for i, group in zip(input_idx[group_starts], np.split(tile_idx, group_starts[1:])):
+                if not on_land[i]:
+                    clip_geometries[i] = tiles[group[0]] if len(group) == 1 else self.dissolve(tiles[group])
+
+        danger_zones = np.full(len(geometries), Polygon(), dtype=object)
+        danger_zones[~on_land] = shapely.difference(geometries[~on_land], clip_geometries[~on_land])
+        if len(geometries):
+            elapsed = time.perf_counter() - started
+            print(f"Clipped {len(geometries)} buffers against {len(tile_idx)} tiles in {elapsed:.3f}s "
+                  f"({1000 * elapsed / len(geometries):.2f} ms per plant)")
+        return danger_zones
+
+def load_land_mask(bucket_name, file_path):
+    """
+    Returns the LandMask for the perifereies file, using the cheapest source available:
+    the in-process cache, then the precomputed WKB artifact in GCS, and only then
+    the full GeoJSON (in which case the artifact is regenerated).
+    """
+    try:
+        source_blob = get_gcs_blob(bucket_name, file_path)
+        source_blob.reload()
+        source_hash = base64.b64decode(source_blob.md5_hash or source_blob.crc32c).hex()
+    except Exception as e:
+        print(f"Error reading perifereies metadata: {e}")
+        return None
+
+    if _LAND_MASK_CACHE.get('source_hash') == source_hash:
+        print("Reusing in-process land mask.")
+        return _LAND_MASK_CACHE['land_mask']
+
+    started = time.perf_counter()
+    cache_blob = get_gcs_blob(bucket_name, LAND_MASK_CACHE_PATH_TEMPLATE.format(
+        version=LAND_MASK_CACHE_VERSION, source_hash=source_hash, max_vertices=LAND_MASK_TILE_MAX_VERTICES,
+        buffer_meters=BUFFER_DISTANCE_METERS, simplify_meters=COARSE_MASK_SIMPLIFY_METERS,
+        margin_meters=COARSE_MASK_MARGIN_METERS
+    ))
+    land_mask = None
+    try:
+        if cache_blob.exists():
+            land_mask = LandMask.from_wkb(cache_blob.download_as_bytes())
+            print(f"Loaded precomputed land mask gs://{bucket_name}/{cache_blob.name} "
+                  f"in {time.perf_counter() - started:.3f}s")
+    except Exception as e:
+        print(f"Error loading precomputed land mask: {e}. Rebuilding from GeoJSON.")
+
+    if land_mask is None:
+        perifereies_geometries = load_perifereies_data(bucket_name, file_path)
+        if not perifereies_geometries:
+            return None
+        land_mask = LandMask.from_geometries(perifereies_geometries)
+        print(f"Built land mask from GeoJSON in {time.perf_counter() - started:.3f}s")
+        try:
+            cache_blob.upload_from_string(land_mask.to_wkb(), content_type="application/octet-stream")
+            print(f"Saved precomputed land mask to gs://{bucket_name}/{cache_blob.name}")
+        except Exception as e:
+            # Not fatal: the next cold start simply rebuilds it
+            print(f"Failed to save precomputed land mask: {e}")
+
+    land_mask.source_hash = source_hash
+    _LAND_MASK_CACHE['source_hash'] = source_hash
+    _LAND_MASK_CACHE['land_mask'] = land_mask
+    return land_mask
+
+def _bulk_transform(transformer):
+    """Adapts a pyproj `transform` so shapely.transform projects every coordinate in one array call."""
+    def _transform(coords):
+        x, y = transformer(coords[:, 0], coords[:, 1])
+        return np.column_stack((x, y))
+    return _transform
+
+def get_plant_features(wastewater_data):
+    """Returns the list of plant records from the API payload, or None if the format is unknown."""
+    if isinstance(wastewater_data, dict) and 'features' in wastewater_data:
+        return wastewater_data['features']
+    if isinstance(wastewater_data, list):
+        return wastewater_data
+    return None
+
+def plant_code(plant_feature):
+    """Returns the plant's `code`, or None if the record has none (or is malformed)."""
+    props = plant_feature.get('properties', plant_feature) if isinstance(plant_feature, dict) else None
+    return props.get('code') if isinstance(props, dict) else None
+
+def plant_fingerprint(plant_feature):
+    """Hashes only the plant fields that feed into its no-swim zone."""
+    props = plant_feature.get('properties', plant_feature)
+    relevant = {field: props.get(field) for field in ZONE_FINGERPRINT_FIELDS}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode('utf-8')).hexdigest()
+
+def calculate_zones_incremental(land_mask, wastewater_data, manifest, existing_features):
+    """
+    Recomputes zones only for plants that were added or modified since `manifest`,
+    reusing `existing_features` for the rest and dropping removed plants.
+
+    Falls back to a full recomputation when the manifest does not match the current
+    land mask / buffer distance, or when plants cannot be keyed by a unique `code`.
+    Returns (features, new_manifest).
     """
-    Performs the core geospatial analysis: buffering, union, and difference.
+    plant_features = get_plant_features(wastewater_data)
+    if plant_features is None:
+        print("Invalid wastewater data format.")
+        return [], None
+
+    fingerprints = {}
+    for plant_feature in plant_features:
+        code = plant_code(plant_feature)
+        if code is None or code in fingerprints:
+            fingerprints = None
+            break
+        fingerprints[code] = plant_fingerprint(plant_feature)
+
+    new_manifest = None
+    if fingerprints is not None:
+        new_manifest = {
+            'land_mask_hash': land_mask.source_hash,
+            'buffer_distance_meters': BUFFER_DISTANCE_METERS,
+            'plants': fingerprints
+        }
+
+    reusable = (
+        new_manifest is not None
+        and manifest is not None
+        and existing_features is not None
+        and manifest.get('land_mask_hash') == new_manifest['land_mask_hash']
+        and manifest.get('buffer_distance_meters') == BUFFER_DISTANCE_METERS
+    )
+    if not reusable:
+        print("Per-plant manifest not usable. Recomputing all zones.")
+        return calculate_new_zones(land_mask, plant_features), new_manifest
+
+    previous = manifest.get('plants', {})
+    changed_codes = {code for code, fingerprint in fingerprints.items() if previous.get(code) != fingerprint}
+    removed_count = len(set(previous) - set(fingerprints))
+    print(f"Incremental update: {len(changed_codes)} added/modified, {removed_count} removed, "
+          f"{len(fingerprints) - len(changed_codes)} unchanged plants.")
+
+    changed_plants = [
+        f for f in plant_features if plant_code(f) in changed_codes
+    ]
+    new_features = calculate_new_zones(land_mask, changed_plants) if changed_plants else []
+
+    # Splice in API order, so the result matches a full recomputation
+    zones_by_code = {}
+    for feature in existing_features:
+        code = feature.get('properties', {}).get('code')
+        if code in fingerprints and code not in changed_codes:
+            zones_by_code.setdefault(code, []).append(feature)
+    for feature in new_features:
+        zones_by_code.setdefault(feature['properties'].get('code'), []).append(feature)
+
+    spliced = []
+    for code in fingerprints:
+        spliced.extend(zones_by_code.get(code, []))
+    return spliced, new_manifest
+
+def calculate_new_zones(land_mask, wastewater_data):
+    """
+    Performs the core geospatial analysis: buffering and difference against the land mask.
     Returns a list of GeoJSON features.
     """
     print("Starting geospatial analysis...")
     no_swim_zones_with_metadata = []
 
-    if not perifereies_geometries:
-        print("Perifereies geometries are empty. Cannot calculate differences.")
+    if land_mask is None or not land_mask.parts:
+        print("Land mask is empty. Cannot calculate differences.")
         return []
 
-    # Create the single, unified geometry for the difference operation
-    unified_perifereies = cascaded_union(perifereies_geometries)
-    print("Perifereies unified successfully.")
-
-    if isinstance(wastewater_data, dict) and 'features' in wastewater_data:
-        features_to_process = wastewater_data['features']
-    elif isinstance(wastewater_data, list):
-        features_to_process = wastewater_data
-    else:
+    features_to_process = get_plant_features(wastewater_data)
+    if features_to_process is None:
         print("Invalid wastewater data format.")
         return []
 
+    # 1. Collect the metadata and raw coordinates of every plant
+    plants = []
+    receiver_location_wkts = []
+    longitudes = []
+    latitudes = []
     for plant_feature in features_to_process:
         try:
             props = plant_feature.get('properties', plant_feature)
@@ -102,60 +674,88 @@ def calculate_new_zones(perifereies_geometries, wastewater_data):
                 'receiverNameEn': props.get('receiverNameEn'),
                 'receiverWaterType': props.get('receiverWaterType'),
                 'latitude': props.get('latitude'),
-                'longitude': props.get('longitude')
+                'longitude': props.get('longitude'),
+                'administrativeRegionId': props.get('administrativeRegionId'),
+                'administrativeRegion': props.get('administrativeRegion')
             }
 
-            receiver_location_wkt = props.get('receiverLocation')
             longitude = props.get('longitude')
             latitude = props.get('latitude')
+            has_coordinates = longitude is not None and latitude is not None
+            longitudes.append(float(longitude) if has_coordinates else np.nan)
+            latitudes.append(float(latitude) if has_coordinates else np.nan)
+            receiver_location_wkts.append(props.get('receiverLocation') or None)
+            plants.append((props, metadata))
 
-            point_wgs84 = None
-            
-            # 1. Determine the discharge point
-            if receiver_location_wkt:
-                try:
-                    point_wgs84 = wkt.loads(receiver_location_wkt)
-                except Exception as e:
-                    print(f"Error parsing WKT for plant '{metadata.get('name')}': {e}. Falling back to main coordinates.")
-            
-            if point_wgs84 is None and longitude is not None and latitude is not None:
-                point_wgs84 = Point(longitude, latitude)
-            
-            if point_wgs84 is None or point_wgs84.is_empty:
-                print(f"Skipping plant '{metadata.get('name')}' due to missing or invalid coordinates.")
-                continue
-
-            # 2. Project the WGS84 point to the metric Greek Grid (EPSG:2100)
-            point_greek_grid = transform(transformer_to_greek_grid, point_wgs84)
-
-            # 3. Buffer the point in meters
-            buffered_point_greek_grid = point_greek_grid.buffer(BUFFER_DISTANCE_METERS)
-            
-            # 4. Project the buffer back to WGS84 
-            buffered_point_wgs84 = transform(transformer_to_wgs84, buffered_point_greek_grid)
-            
-            # 5. Perform Difference: Find the part of the buffer that is *not* on the mainland
-            danger_zone = buffered_point_wgs84.difference(unified_perifereies)
-            
-            if not danger_zone.is_empty:
-                # Store as a GeoJSON Feature object
-                # Adding 'location' and 'compliance' keys for KML conversion compatibility
-                kml_properties = {
-                    'location': metadata.get('name', 'Unknown Location'),
-                    'Column1.compliance': props.get('is_compliant', True), # Assuming a 'is_compliant' key or defaulting to True
-                    'details': f"Code: {metadata.get('code', 'N/A')}. Receiver: {metadata.get('receiverName', 'N/A')}",
-                    **metadata
-                }
-                no_swim_zones_with_metadata.append({
-                    "type": "Feature",
-                    "geometry": mapping(danger_zone),
-                    "properties": kml_properties
-                })
-        
         except Exception as e:
             print(f"Skipping plant due to an error processing its data: {e}")
             continue
 
+    if not plants:
+        print("Geospatial analysis complete. Found 0 no-swim zones.")
+        return []
+
+    longitudes = np.array(longitudes)
+    latitudes = np.array(latitudes)
+    receiver_location_wkts = np.array(receiver_location_wkts, dtype=object)
+
+    # 2. Determine the discharge points: receiverLocation WKT, falling back to the main coordinates
+    points_wgs84 = shapely.from_wkt(receiver_location_wkts, on_invalid='ignore')
+    for i in np.flatnonzero(shapely.is_missing(points_wgs84) & (receiver_location_wkts != None)):
+        print(f"Error parsing WKT for plant '{plants[i][1].get('name')}'. Falling back to main coordinates.")
+
+    use_fallback = shapely.is_missing(points_wgs84) & np.isfinite(longitudes) & np.isfinite(latitudes)
+    points_wgs84[use_fallback] = shapely.points(longitudes[use_fallback], latitudes[use_fallback])
+
+    valid = ~shapely.is_missing(points_wgs84)
+    valid[valid] = ~shapely.is_empty(points_wgs84[valid])
+    for i in np.flatnonzero(~valid):
+        print(f"Skipping plant '{plants[i][1].get('name')}' due to missing or invalid coordinates.")
+    plant_idx = np.flatnonzero(valid)
+
+    # 3. Project all discharge points to the metric Greek Grid (EPSG:2100) in one call
+    points_greek_grid = shapely.transform(points_wgs84[plant_idx], _bulk_transform(transformer_to_greek_grid))
+
+    # 4. Buffer all points in meters (quad_segs matches the BaseGeometry.buffer default)
+    buffered_points_greek_grid = shapely.buffer(points_greek_grid, BUFFER_DISTANCE_METERS, quad_segs=16)
+
+    # 5. Project all buffer rings back to WGS84 in one call
+    buffered_points_wgs84 = shapely.transform(buffered_points_greek_grid, _bulk_transform(transformer_to_wgs84))
+
+    # 6. Coastal pre-filter: bucket the plants so only the near-coast ones need the exact clip
+    x_greek_grid = shapely.get_x(points_greek_grid)
+    y_greek_grid = shapely.get_y(points_greek_grid)
+    is_point = shapely.get_type_id(points_greek_grid) == 0
+    inland_core, coastal_band = land_mask.coarse_masks
+    inland = is_point & shapely.contains_xy(inland_core, x_greek_grid, y_greek_grid)
+    offshore = is_point & ~shapely.intersects_xy(coastal_band, x_greek_grid, y_greek_grid)
+    near_coast = ~inland & ~offshore
+    print(f"Coastal pre-filter: {inland.sum()} inland, {offshore.sum()} offshore, "
+          f"{near_coast.sum()} near the coast (exact clip).")
+
+    # 7. Perform Difference: Find the part of each buffer that is *not* on the mainland
+    danger_zones = np.full(len(plant_idx), Polygon(), dtype=object)
+    danger_zones[offshore] = land_mask.clip_at_sea(buffered_points_wgs84[offshore])
+    danger_zones[near_coast] = land_mask.clip_many(buffered_points_wgs84[near_coast])
+
+    for i, danger_zone in zip(plant_idx, danger_zones):
+        if danger_zone.is_empty:
+            continue
+        props, metadata = plants[i]
+        # Store as a GeoJSON Feature object
+        # Adding 'location' and 'compliance' keys for KML conversion compatibility
+        kml_properties = {
+            'location': metadata.get('name', 'Unknown Location'),
+            'Column1.compliance': props.get('is_compliant', True), # Assuming a 'is_compliant' key or defaulting to True
+            'details': f"Code: {metadata.get('code', 'N/A')}. Receiver: {metadata.get('receiverName', 'N/A')}",
+            **metadata
+        }
+        no_swim_zones_with_metadata.append({
+            "type": "Feature",
+            "geometry": mapping(danger_zone),
+            "properties": kml_properties
+        })
+
     print(f"Geospatial analysis complete. Found {len(no_swim_zones_with_metadata)} no-swim zones.")
     return no_swim_zones_with_metadata
 
@@ -163,192 +763,1498 @@ def calculate_new_zones(perifereies_geometries, wastewater_data):
 # --- HELPER FUNCTIONS (KML/Drive) ---
 # ======================================================================
 
+def encode_zones_sidecar(features, geojson_generation):
+    """
+    Encodes zone features as a compressed .npz: concatenated WKB geometries with their
+    offsets, plus the properties as a columnar JSON table. `geojson_generation` ties the
+    sidecar to the GeoJSON object it mirrors.
+    """
+    geometries = np.array([shape(f['geometry']) for f in features], dtype=object)
+    wkb = shapely.to_wkb(geometries) if len(geometries) else np.array([], dtype=object)
+    offsets = np.cumsum([0] + [len(b) for b in wkb], dtype=np.int64)
+
+    rows = [f.get('properties', {}) for f in features]
+    keys = list(dict.fromkeys(key for row in rows for key in row))
+    table = {
+        'keys': keys,
+        'columns': {key: [row.get(key) for row in rows] for key in keys},
+        'missing': {key: [i for i, row in enumerate(rows) if key not in row] for key in keys}
+    }
+
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        wkb=np.frombuffer(b''.join(wkb), dtype=np.uint8),
+        offsets=offsets,
+        properties=np.frombuffer(json.dumps(table).encode('utf-8'), dtype=np.uint8),
+        geojson_generation=np.int64(geojson_generation if geojson_generation is not None else -1)
+    )
+    return buffer.getvalue()
+
+def decode_zones_sidecar(data, geojson_geometries=True):
+    """
+    Decodes a sidecar written by `encode_zones_sidecar` into (features, geometries, geojson_generation).
+    With geojson_geometries=False the features' 'geometry' is left as None (for callers that
+    work on the shapely geometries and only need GeoJSON for a few of them).
+    """
+    with np.load(io.BytesIO(data)) as npz:
+        wkb = npz['wkb'].tobytes()
+        offsets = npz['offsets']
+        table = json.loads(npz['properties'].tobytes())
+        geojson_generation = int(npz['geojson_generation'])
+
+    geometries = shapely.from_wkb(np.array(
+        [wkb[start:end] for start, end in zip(offsets[:-1], offsets[1:])], dtype=object
+    ))
+    missing = {key: set(rows) for key, rows in table['missing'].items()}
+    features = [
+        {
+            "type": "Feature",
+            "geometry": mapping(geometry) if geojson_geometries else None,
+            "properties": {
+                key: table['columns'][key][i] for key in table['keys'] if i not in missing[key]
+            }
+        }
+        for i, geometry in enumerate(geometries)
+    ]
+    return features, geometries, (geojson_generation if geojson_generation >= 0 else None)
+
+def save_zones_sidecar(features, geojson_generation):
+    """Writes the binary sidecar for freshly published zones."""
+    sidecar_blob = get_gcs_blob(GCS_BUCKET_NAME, ZONES_SIDECAR_PATH)
+    sidecar_blob.upload_from_string(
+        encode_zones_sidecar(features, geojson_generation), content_type="application/octet-stream"
+    )
+    print(f"Saved zones sidecar to gs://{GCS_BUCKET_NAME}/{ZONES_SIDECAR_PATH}")
+
+def load_published_zones(geojson_geometries=True):
+    """
+    Returns (features, geometries, generation) for the published zones, using the fastest
+    representation available: the binary sidecar when it mirrors the current GeoJSON
+    generation, else the GeoJSON itself (geometries is then None).
+    See `decode_zones_sidecar` for `geojson_geometries`.
+    """
+    started = time.perf_counter()
+    blob = get_gcs_blob(GCS_BUCKET_NAME, GEOJSON_PATH)
+    blob.reload()
+    generation = blob.generation
+
+    try:
+        sidecar_blob = get_gcs_blob(GCS_BUCKET_NAME, ZONES_SIDECAR_PATH)
+        if sidecar_blob.exists():
+            features, geometries, geojson_generation = decode_zones_sidecar(
+                sidecar_blob.download_as_bytes(), geojson_geometries
+            )
+            if geojson_generation == generation:
+                print(f"Loaded {len(features)} zones from sidecar in {time.perf_counter() - started:.3f}s")
+                return features, geometries, generation
+            print("Zones sidecar does not match the published GeoJSON. Reading GeoJSON.")
+    except Exception as e:
+        print(f"Error reading zones sidecar: {e}. Reading GeoJSON.")
+
+    geojson_data = json.loads(blob.download_as_bytes(if_generation_match=generation))
+    features = geojson_data.get('features', [])
+    print(f"Loaded {len(features)} zones from GeoJSON in {time.perf_counter() - started:.3f}s")
+    return features, None, generation
+
 def get_geojson_from_gcs():
-    """Download GeoJSON from GCS"""
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(GCS_BUCKET_NAME)
-    blob = bucket.blob(GEOJSON_PATH)
-    geojson_data = json.loads(blob.download_as_text())
-    return geojson_data
-
-def geojson_to_kml(geojson_data):
-    """Convert GeoJSON to KML format"""
-    kml = simplekml.Kml()
-    
-    for feature in geojson_data.get('features', []):
-        geometry = feature.get('geometry', {})
-        properties = feature.get('properties', {})
-        geom_type = geometry.get('type')
-        coordinates = geometry.get('coordinates', [])
-        
-        # Get properties for styling and info (using the enhanced properties saved in calculate_new_zones)
-        location = properties.get('location', 'Unknown Location')
-        compliance = properties.get('Column1.compliance', None)
-        details = properties.get('details', 'No details available')
-        
-        # Create description
-        description = f"""
-        <![CDATA[
-        <b>Name:</b> {properties.get('name', 'N/A')}<br>
-        <b>Code:</b> {properties.get('code', 'N/A')}<br>
-        <b>Receiver:</b> {properties.get('receiverName', 'N/A')}<br>
-        <b>Compliance:</b> {'⚠️ NON-COMPLIANT' if compliance is False else '✓ Compliant'}<br>
-        <b>Details:</b> {details}
-        ]]>
-        """
-        
-        # Determine color based on compliance
-        if compliance is False:
-            color = simplekml.Color.red
-        else:
-            # We'll use a slightly different color for zones to differentiate from points if needed, e.g., Semi-Transparent Blue
-            color = simplekml.Color.changealphaint(150, simplekml.Color.blue) 
-        
-        # Add geometry to KML
-        if geom_type == 'Polygon':
-            coords = coordinates[0]
-            kml_coords = [(coord[0], coord[1]) for coord in coords]
-            
-            pol = kml.newpolygon(name=location, description=description)
-            pol.outerboundaryis = kml_coords
-            pol.style.polystyle.color = color
-            pol.style.polystyle.fill = 1
-            pol.style.polystyle.outline = 1
-            pol.style.linestyle.color = simplekml.Color.white
-            pol.style.linestyle.width = 2
-            
-        elif geom_type == 'MultiPolygon':
-            for i, polygon in enumerate(coordinates):
-                coords = polygon[0]
-                kml_coords = [(coord[0], coord[1]) for coord in coords]
-                
-                pol = kml.newpolygon(name=f"{location} Part {i+1}", description=description)
-                pol.outerboundaryis = kml_coords
-                pol.style.polystyle.color = color
-                pol.style.polystyle.fill = 1
-                pol.style.polystyle.outline = 1
-                pol.style.linestyle.color = simplekml.Color.white
-                pol.style.linestyle.width = 2
-            
-    # Generate KML string
-    kml_string = kml.kml()
-    return kml_string
+    """Download GeoJSON from GCS (via the binary sidecar when it is current)"""
+    features, _, _ = load_published_zones()
+    return {"type": "FeatureCollection", "features": features}
+
+def _kml_ring(ring):
+    """Formats a GeoJSON ring as a KML <LinearRing>."""
+    coordinates = " ".join(f"{x:.{KML_COORDINATE_DECIMALS}f},{y:.{KML_COORDINATE_DECIMALS}f}" for x, y, *_ in ring)
+    return f"<LinearRing><coordinates>{coordinates}</coordinates></LinearRing>"
+
+def _kml_polygon(rings):
+    """Formats GeoJSON polygon rings (outer first, then holes) as a KML <Polygon>."""
+    if not rings:
+        return ""
+    parts = [f"<Polygon><outerBoundaryIs>{_kml_ring(rings[0])}</outerBoundaryIs>"]
+    parts.extend(f"<innerBoundaryIs>{_kml_ring(ring)}</innerBoundaryIs>" for ring in rings[1:])
+    parts.append("</Polygon>")
+    return "".join(parts)
+
+def _kml_styles():
+    """Returns the shared <Style> elements that placemarks reference by styleUrl."""
+    return "".join(
+        f'<Style id="{style_id}">'
+        f'<LineStyle><color>{style["line_color"]}</color><width>{style["line_width"]}</width></LineStyle>'
+        f'<PolyStyle><color>{style["poly_color"]}</color><fill>1</fill><outline>1</outline></PolyStyle>'
+        f'</Style>\n'
+        for style_id, style in KML_STYLES.items()
+    )
+
+def _kml_placemark(geometry, properties):
+    """Formats one zone as a KML <Placemark>, or returns None for non-polygonal geometry."""
+    geom_type = geometry.get('type')
+    coordinates = geometry.get('coordinates', [])
+
+    if geom_type == 'Polygon':
+        kml_geometry = _kml_polygon(coordinates)
+    elif geom_type == 'MultiPolygon':
+        kml_geometry = "<MultiGeometry>" + "".join(_kml_polygon(polygon) for polygon in coordinates) + "</MultiGeometry>"
+    else:
+        return None
+
+    # Get properties for styling and info (using the enhanced properties saved in calculate_new_zones)
+    location = properties.get('location', 'Unknown Location')
+    compliance = properties.get('Column1.compliance', None)
+    details = properties.get('details', 'No details available')
+
+    description = (
+        f"<b>Name:</b> {properties.get('name', 'N/A')}<br>"
+        f"<b>Code:</b> {properties.get('code', 'N/A')}<br>"
+        f"<b>Receiver:</b> {properties.get('receiverName', 'N/A')}<br>"
+        f"<b>Compliance:</b> {'⚠️ NON-COMPLIANT' if compliance is False else '✓ Compliant'}<br>"
+        f"<b>Details:</b> {details}"
+    ).replace("]]>", "]]]]><![CDATA[>")
+
+    return (
+        f"<Placemark><name>{xml_escape(str(location))}</name>"
+        f"<description><![CDATA[{description}]]></description>"
+        f"<styleUrl>#{'non_compliant' if compliance is False else 'compliant'}</styleUrl>"
+        f"{kml_geometry}</Placemark>\n"
+    )
+
+class KmlFragmentCache:
+    """
+    Thread-safe, content-addressed LRU cache of rendered KML Placemark fragments, bounded by
+    their total size. A key hashes the zone's geometry WKB with the properties its Placemark
+    shows, so a fragment is reused for as long as the zone renders the same way.
+    """
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(wkb, properties):
+        relevant = {field: properties.get(field) for field in KML_FRAGMENT_FIELDS}
+        digest = hashlib.sha256(f"v{KML_FRAGMENT_CACHE_VERSION}:{KML_COORDINATE_DECIMALS}:".encode('utf-8'))
+        digest.update(wkb)
+        digest.update(json.dumps(relevant, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached fragment, or None."""
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def put(self, key, fragment):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = fragment
+            self._size += len(fragment)
+            self.dirty = True
+            while self._size > self.max_chars and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def snapshot(self):
+        """Returns the entries, least recently used first."""
+        with self._lock:
+            return dict(self._entries)
 
-def upload_to_drive(file_content, filename, folder_id=None):
-    """Upload file to Google Drive. Updates if file exists."""
+    def restore(self, entries):
+        """Adds saved entries (least recently used first), e.g. from `snapshot`."""
+        for key, fragment in entries.items():
+            self.put(key, fragment)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'chars': self._size,
+                'max_chars': self.max_chars,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions
+            }
+
+_KML_FRAGMENT_CACHE = KmlFragmentCache(KML_FRAGMENT_CACHE_MAX_CHARS)
+
+def load_kml_fragment_cache():
+    """Seeds the in-process fragment cache from the snapshot in GCS, once per instance."""
+    if _KML_FRAGMENT_CACHE.loaded:
+        return
+    _KML_FRAGMENT_CACHE.loaded = True
     try:
+        cache_blob = get_gcs_blob(GCS_BUCKET_NAME, KML_FRAGMENT_CACHE_PATH)
+        if cache_blob.exists():
+            entries = json.loads(cache_blob.download_as_bytes())
+            _KML_FRAGMENT_CACHE.restore(entries)
+            _KML_FRAGMENT_CACHE.dirty = False
+            print(f"Loaded {len(entries)} cached KML fragments")
+    except Exception as e:
+        print(f"Error loading KML fragment cache: {e}. Rendering all placemarks.")
+
+def save_kml_fragment_cache():
+    """Saves the fragment cache to GCS if this instance rendered anything new."""
+    if not _KML_FRAGMENT_CACHE.dirty:
+        return
+    try:
+        cache_blob = get_gcs_blob(GCS_BUCKET_NAME, KML_FRAGMENT_CACHE_PATH)
+        upload_gzipped(cache_blob, json.dumps(_KML_FRAGMENT_CACHE.snapshot()), "application/json")
+        _KML_FRAGMENT_CACHE.dirty = False
+    except Exception as e:
+        # Not fatal: the fragments are rendered again next time
+        print(f"Failed to save KML fragment cache: {e}")
+
+def _cached_kml_placemark(geometry, properties, wkb):
+    """Returns the Placemark for a zone from the fragment cache, rendering it on a miss."""
+    key = KmlFragmentCache.key(wkb, properties)
+    fragment = _KML_FRAGMENT_CACHE.get(key)
+    if fragment is None:
+        fragment = _kml_placemark(geometry, properties) or ""
+        _KML_FRAGMENT_CACHE.put(key, fragment)
+    return fragment
+
+def _polygon_from_rings(rings):
+    rings = [np.asarray(ring, dtype=float)[:, :2] for ring in rings]
+    return shapely.polygons(rings[0], holes=rings[1:] or None)
+
+def _shape_polygonal(geometry):
+    """shape() for a GeoJSON Polygon/MultiPolygon, building rings from arrays (a few times faster)."""
+    if geometry['type'] == 'Polygon':
+        return _polygon_from_rings(geometry['coordinates'])
+    return shapely.multipolygons([_polygon_from_rings(polygon) for polygon in geometry['coordinates']])
+
+def _polygonal_features(geojson_data):
+    """Returns (features, geometries, wkb) for the Polygon/MultiPolygon zones of a FeatureCollection."""
+    features = [
+        f for f in geojson_data.get('features', [])
+        if (f.get('geometry') or {}).get('type') in ('Polygon', 'MultiPolygon')
+    ]
+    geometries = np.array([_shape_polygonal(f['geometry']) for f in features], dtype=object)
+    wkb = shapely.to_wkb(geometries) if len(geometries) else []
+    return features, geometries, wkb
+
+def write_kml(geojson_data, out, name=None):
+    """
+    Streams GeoJSON zones as a KML document (UTF-8) into the binary file-like `out`.
+    Styles are emitted once and shared; a MultiPolygon becomes one Placemark with a
+    <MultiGeometry>. Returns the number of bytes written.
+    """
+    written = 0
+    def emit(text):
+        nonlocal written
+        data = text.encode('utf-8')
+        out.write(data)
+        written += len(data)
+
+    emit('<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n')
+    if name:
+        emit(f"<name>{xml_escape(name)}</name>\n")
+    emit(_kml_styles())
+
+    features, _, wkb = _polygonal_features(geojson_data)
+    for feature, feature_wkb in zip(features, wkb):
+        emit(_cached_kml_placemark(feature['geometry'], feature.get('properties', {}), feature_wkb))
+
+    emit("</Document></kml>\n")
+    return written
+
+def _kml_region(bounds, min_lod_pixels, max_lod_pixels):
+    """Formats a <Region> over (west, south, east, north) with the given level-of-detail range."""
+    west, south, east, north = bounds
+    return (
+        f"<Region><LatLonAltBox><north>{north:.6f}</north><south>{south:.6f}</south>"
+        f"<east>{east:.6f}</east><west>{west:.6f}</west></LatLonAltBox>"
+        f"<Lod><minLodPixels>{min_lod_pixels}</minLodPixels><maxLodPixels>{max_lod_pixels}</maxLodPixels></Lod></Region>"
+    )
+
+def _kml_tile_link(tile_name, bounds, min_lod_pixels=KML_TILE_MIN_LOD_PIXELS):
+    """Formats a Region-gated NetworkLink to another tile in the same KMZ."""
+    return (
+        f"<NetworkLink>{_kml_region(bounds, min_lod_pixels, -1)}"
+        f"<Link><href>{tile_name}</href><viewRefreshMode>onRegion</viewRefreshMode></Link></NetworkLink>\n"
+    )
+
+def write_kml_tiles(geojson_data, kmz, name=None):
+    """
+    Writes the zones into the open ZipFile `kmz` as a quadtree of Region/Lod-gated KML tiles,
+    so clients only fetch and draw the tiles in view. Returns the total KML size.
+
+    Each zone belongs to the tile (per level) holding its representative point; the leaf tile
+    of every zone is computed in one vectorized pass and coarser tiles are bit shifts of it.
+    Tiles with more than KML_TILE_MAX_FEATURES zones are split, down to KML_TILE_MAX_LEVEL.
+    Inner tiles carry geometry simplified to their display resolution and hand over to their
+    children when zoomed in; leaves carry the full geometry.
+    """
+    features, geometries, wkb = _polygonal_features(geojson_data)
+    header = '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+    if name:
+        header += f"<name>{xml_escape(name)}</name>\n"
+
+    written = 0
+    def write_entry(entry_name, text):
+        nonlocal written
+        data = text.encode('utf-8')
+        with kmz.open(_kmz_entry(entry_name), 'w') as entry:
+            entry.write(data)
+        written += len(data)
+
+    if not features:
+        write_entry('doc.kml', header + "</Document></kml>\n")
+        return written
+
+    minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+    size = max(maxx - minx, maxy - miny) or 1e-6
+    points = shapely.point_on_surface(geometries)
+
+    leaf_tiles = 2 ** KML_TILE_MAX_LEVEL
+    leaf_cols = np.clip(((shapely.get_x(points) - minx) / size * leaf_tiles).astype(np.int64), 0, leaf_tiles - 1)
+    leaf_rows = np.clip(((shapely.get_y(points) - miny) / size * leaf_tiles).astype(np.int64), 0, leaf_tiles - 1)
+
+    def tile_bounds(level, col, row):
+        tile_size = size / 2 ** level
+        return (minx + col * tile_size, miny + row * tile_size,
+                minx + (col + 1) * tile_size, miny + (row + 1) * tile_size)
+
+    def tile_name(level, col, row):
+        return f"tile_{level}_{col}_{row}.kml"
+
+    tile_count = 0
+    def write_tile(level, col, row, zone_idx):
+        nonlocal tile_count
+        tile_count += 1
+        bounds = tile_bounds(level, col, row)
+        is_leaf = level == KML_TILE_MAX_LEVEL or len(zone_idx) <= KML_TILE_MAX_FEATURES
+
+        if is_leaf:
+            placemarks = "".join(
+                _cached_kml_placemark(features[i]['geometry'], features[i].get('properties', {}), wkb[i])
+                for i in zone_idx
+            )
+        else:
+            simplified = shapely.simplify(geometries[zone_idx], (bounds[2] - bounds[0]) / KML_TILE_PIXELS)
+            placemarks = "".join(
+                _kml_placemark(mapping(geometry), features[i].get('properties', {})) or ""
+                for i, geometry in zip(zone_idx, simplified) if not geometry.is_empty
+            )
+
+        children = []
+        if not is_leaf:
+            shift = KML_TILE_MAX_LEVEL - level - 1
+            child_cols = leaf_cols[zone_idx] >> shift
+            child_rows = leaf_rows[zone_idx] >> shift
+            for child_col in (2 * col, 2 * col + 1):
+                for child_row in (2 * row, 2 * row + 1):
+                    child_idx = zone_idx[(child_cols == child_col) & (child_rows == child_row)]
+                    if len(child_idx):
+                        write_tile(level + 1, child_col, child_row, child_idx)
+                        children.append(_kml_tile_link(
+                            tile_name(level + 1, child_col, child_row), tile_bounds(level + 1, child_col, child_row)
+                        ))
+
+        # The tile's own placemarks sit in a Folder with their own Lod range; the child links
+        # stay active (and take over) when the folder is zoomed past KML_TILE_MAX_LOD_PIXELS
+        write_entry(tile_name(level, col, row), (
+            header + _kml_styles()
+            + f"<Folder>{_kml_region(bounds, KML_TILE_MIN_LOD_PIXELS, -1 if is_leaf else KML_TILE_MAX_LOD_PIXELS)}\n"
+            + placemarks + "</Folder>\n"
+            + "".join(children) + "</Document></kml>\n"
+        ))
+
+    write_tile(0, 0, 0, np.arange(len(features)))
+    # The root tile is always loaded
+    write_entry('doc.kml', header + _kml_tile_link(tile_name(0, 0, 0), tile_bounds(0, 0, 0), -1) + "</Document></kml>\n")
+    print(f"Wrote {len(features)} zones as {tile_count} KML tiles")
+    return written
+
+def _kmz_entry(entry_name):
+    """A deflated zip entry with a fixed timestamp, so the same content always gives the same KMZ bytes."""
+    entry = zipfile.ZipInfo(entry_name, date_time=(1980, 1, 1, 0, 0, 0))
+    entry.compress_type = zipfile.ZIP_DEFLATED
+    return entry
+
+def write_kmz(geojson_data, out, name=None, tiled=False):
+    """
+    Streams GeoJSON zones as a KMZ into `out`: a single doc.kml, or with tiled=True the
+    quadtree from `write_kml_tiles`. Returns the KML size.
+    """
+    with zipfile.ZipFile(out, 'w') as kmz:
+        if tiled:
+            return write_kml_tiles(geojson_data, kmz, name)
+        with kmz.open(_kmz_entry('doc.kml'), 'w') as doc:
+            return write_kml(geojson_data, doc, name)
+
+def write_region_links_kml(regions, out):
+    """Writes the master KML: one NetworkLink per published region KMZ, in region name order."""
+    out.write(
+        '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+        f'<name>{xml_escape(DRIVE_EXPORT_BASENAME)}</name>\n'.encode('utf-8')
+    )
+    for region in sorted(regions.values(), key=lambda region: region['name']):
+        href = f"https://drive.google.com/uc?export=download&id={region['file_id']}"
+        out.write(
+            f"<NetworkLink><name>{xml_escape(region['name'])}</name>"
+            f"<Link><href>{xml_escape(href)}</href></Link></NetworkLink>\n".encode('utf-8')
+        )
+    out.write(b"</Document></kml>\n")
+
+@contextmanager
+def drive_service():
+    """
+    Lends a Drive v3 service for the duration of a with-block. Service objects aren't
+    thread-safe, so concurrent callers each get their own; they are pooled and reused
+    across warm invocations.
+    """
+    with _DRIVE_LOCK:
+        service = _DRIVE_SERVICE_POOL.pop() if _DRIVE_SERVICE_POOL else None
+    if service is None:
         # Use default credentials (Cloud Function service account)
         credentials = service_account.Credentials.from_service_account_info(
             info={},
             scopes=SCOPES
         )
-        
-        # Build Drive service
         service = build('drive', 'v3', credentials=credentials)
-        
-        # Prepare file metadata
-        file_metadata = {
-            'name': filename,
-            'mimeType': 'application/vnd.google-earth.kml+xml'
-        }
-        
-        if folder_id:
-            file_metadata['parents'] = [folder_id]
-        
-        # Create file in memory
-        fh = io.BytesIO(file_content.encode('utf-8'))
-        media = MediaIoBaseUpload(
-            fh,
-            mimetype='application/vnd.google-earth.kml+xml',
-            resumable=True
-        )
-        
-        # Check if file already exists
-        query = f"name='{filename}' and trashed=false"
-        if folder_id:
-            query += f" and '{folder_id}' in parents"
-        
-        results = service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)'
+    try:
+        yield service
+    finally:
+        with _DRIVE_LOCK:
+            _DRIVE_SERVICE_POOL.append(service)
+
+def find_drive_file(service, filename, folder_id=None):
+    """
+    Returns the metadata (id, md5Checksum, webViewLink) of the Drive file named `filename`,
+    or None. The file id is cached per instance, so warm invocations skip the search.
+    """
+    fields = 'id, name, md5Checksum, webViewLink, trashed'
+    cached = _DRIVE_FILE_CACHE.get((folder_id, filename))
+    if cached:
+        try:
+            file = service.files().get(fileId=cached['file_id'], fields=fields).execute()
+            if not file.get('trashed'):
+                return file
+        except Exception as e:
+            print(f"Cached Drive file id for '{filename}' is no longer valid: {e}")
+        _DRIVE_FILE_CACHE.pop((folder_id, filename), None)
+
+    # Check if file already exists
+    query = f"name='{filename}' and trashed=false"
+    if folder_id:
+        query += f" and '{folder_id}' in parents"
+    
+    results = service.files().list(
+        q=query,
+        spaces='drive',
+        fields=f'files({fields})'
+    ).execute()
+    
+    existing_files = results.get('files', [])
+    if not existing_files:
+        return None
+    _DRIVE_FILE_CACHE[(folder_id, filename)] = {'file_id': existing_files[0]['id'], 'shared': False}
+    return existing_files[0]
+
+def ensure_public_permission(service, file_id, filename, folder_id=None):
+    """Grants 'anyone' read access to the file unless it already has it."""
+    cached = _DRIVE_FILE_CACHE.setdefault((folder_id, filename), {'file_id': file_id, 'shared': False})
+    if cached['file_id'] == file_id and cached['shared']:
+        return
+    permissions = service.permissions().list(
+        fileId=file_id,
+        fields='permissions(type, role)'
+    ).execute().get('permissions', [])
+    if not any(p.get('type') == 'anyone' and p.get('role') == 'reader' for p in permissions):
+        service.permissions().create(
+            fileId=file_id,
+            body={'type': 'anyone', 'role': 'reader'}
         ).execute()
+        print(f"Granted public read access to '{filename}'")
+    _DRIVE_FILE_CACHE[(folder_id, filename)] = {'file_id': file_id, 'shared': True}
+
+def upload_to_drive(file_content, filename, folder_id=None, mimetype=KML_MIMETYPE):
+    """
+    Upload file (text, bytes or a BytesIO buffer) to Google Drive. Updates if file exists,
+    and skips the upload entirely when the existing file already has the same MD5.
+    """
+    try:
+        if isinstance(file_content, str):
+            file_content = file_content.encode('utf-8')
+        if isinstance(file_content, (bytes, bytearray)):
+            file_content = io.BytesIO(file_content)
+        content_md5 = hashlib.md5(file_content.getbuffer()).hexdigest()
+        content_size = file_content.getbuffer().nbytes
+        file_content.seek(0)
         
-        existing_files = results.get('files', [])
+        with drive_service() as service:
+            existing_file = find_drive_file(service, filename, folder_id)
         
-        if existing_files:
-            # Update existing file
-            file_id = existing_files[0]['id']
-            file = service.files().update(
-                fileId=file_id,
-                media_body=media
-            ).execute()
-            action = 'updated'
-        else:
-            # Create new file
-            file = service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id, webViewLink'
-            ).execute()
-            action = 'created'
+            started = time.perf_counter()
+            if existing_file and existing_file.get('md5Checksum') == content_md5:
+                file = existing_file
+                action = 'unchanged'
+                print(f"Drive file '{filename}' already up to date (md5 {content_md5}). Skipping upload.")
+            else:
+                # Create file in memory
+                media = MediaIoBaseUpload(
+                    file_content,
+                    mimetype=mimetype,
+                    resumable=True
+                )
+                if existing_file:
+                    # Update existing file
+                    file = service.files().update(
+                        fileId=existing_file['id'],
+                        media_body=media,
+                        fields='id, md5Checksum, webViewLink'
+                    ).execute()
+                    action = 'updated'
+                else:
+                    # Create new file
+                    file_metadata = {
+                        'name': filename,
+                        'mimeType': mimetype
+                    }
+                    if folder_id:
+                        file_metadata['parents'] = [folder_id]
+                    file = service.files().create(
+                        body=file_metadata,
+                        media_body=media,
+                        fields='id, md5Checksum, webViewLink'
+                    ).execute()
+                    action = 'created'
+                print(f"Drive upload of '{filename}' ({content_size} bytes) {action} in {time.perf_counter() - started:.3f}s")
         
-        # Make file accessible (optional, but good for sharing)
-        permission = {
-            'type': 'anyone',
-            'role': 'reader'
-        }
-        service.permissions().create(
-            fileId=file.get('id'),
-            body=permission
-        ).execute()
+            # Make file accessible (optional, but good for sharing)
+            ensure_public_permission(service, file.get('id'), filename, folder_id)
         
-        return {
-            'file_id': file.get('id'),
-            'web_link': file.get('webViewLink', f"https://drive.google.com/file/d/{file.get('id')}/view"),
-            'action': action
-        }
+            return {
+                'file_id': file.get('id'),
+                'web_link': file.get('webViewLink', f"https://drive.google.com/file/d/{file.get('id')}/view"),
+                'action': action,
+                'md5': content_md5
+            }
         
     except Exception as e:
         print(f"Error uploading to Drive: {e}")
         raise
 
+def publish_regions_to_drive(geojson_data, previous_regions, master_filename):
+    """
+    Publishes one KMZ per administrative region plus a master KML linking to them.
+    Only regions whose KMZ differs from `previous_regions` (the saved sync state) are
+    uploaded, concurrently. Returns upload_to_drive's result for the master file, with
+    the new per-region state under 'regions'.
+    """
+    regions = {}
+    for feature in geojson_data.get('features', []):
+        properties = feature.get('properties', {})
+        region_id = properties.get('administrativeRegionId')
+        key = str(region_id) if region_id is not None else 'unassigned'
+        region = regions.setdefault(key, {'name': properties.get('administrativeRegion') or 'Unassigned', 'features': []})
+        region['features'].append(feature)
+
+    new_regions = {}
+    changed = {}
+    for key, region in regions.items():
+        buffer = io.BytesIO()
+        write_kmz({'features': region['features']}, buffer, region['name'], DRIVE_EXPORT_TILED)
+        previous = previous_regions.get(key, {})
+        new_regions[key] = {
+            'name': region['name'],
+            'filename': f"{DRIVE_EXPORT_BASENAME}_region_{key}.kmz",
+            'md5': hashlib.md5(buffer.getbuffer()).hexdigest(),
+            'file_id': previous.get('file_id')
+        }
+        if new_regions[key]['md5'] != previous.get('md5') or not previous.get('file_id'):
+            changed[key] = buffer
+        if previous.get('file_id'):
+            # Saves a files().list search on a cold instance
+            _DRIVE_FILE_CACHE.setdefault(
+                (DRIVE_FOLDER_ID, new_regions[key]['filename']), {'file_id': previous['file_id'], 'shared': False}
+            )
+    print(f"{len(changed)} of {len(new_regions)} regions changed: {sorted(changed)}")
+
+    if changed:
+        with ThreadPoolExecutor(max_workers=DRIVE_UPLOAD_WORKERS) as executor:
+            futures = {
+                key: executor.submit(upload_to_drive, buffer, new_regions[key]['filename'], DRIVE_FOLDER_ID, KMZ_MIMETYPE)
+                for key, buffer in changed.items()
+            }
+        for key, future in futures.items():
+            new_regions[key]['file_id'] = future.result()['file_id']
+
+    master = io.BytesIO()
+    write_region_links_kml(new_regions, master)
+    drive_result = upload_to_drive(master, master_filename, DRIVE_FOLDER_ID, KML_MIMETYPE)
+    if changed and drive_result['action'] == 'unchanged':
+        drive_result['action'] = 'updated'
+    drive_result['regions'] = new_regions
+    return drive_result
+
+# ======================================================================
+# --- HELPER FUNCTIONS (Vector tiles) ---
+# ======================================================================
+
+# Minimal protobuf writers for the Mapbox Vector Tile 2.1 schema (Tile.layers = 3;
+# Layer: name = 1, features = 2, keys = 3, values = 4, extent = 5, version = 15;
+# Feature: id = 1, tags = 2, type = 3, geometry = 4)
+
+def _pb_varint(value):
+    """Encodes a non-negative int as a protobuf varint."""
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _pb_field(field, data):
+    """Encodes a length-delimited field (string, bytes, sub-message or packed values)."""
+    return _pb_varint((field << 3) | 2) + _pb_varint(len(data)) + data
+
+def _pb_uint(field, value):
+    """Encodes a varint field."""
+    return _pb_varint(field << 3) + _pb_varint(value)
+
+def _zigzag(value):
+    return (value << 1) if value >= 0 else ((-value) << 1) - 1
+
+def _mvt_value(value):
+    """Encodes a property value as an MVT Value message."""
+    if isinstance(value, bool):
+        return _pb_uint(7, int(value))
+    if isinstance(value, int):
+        return _pb_uint(6, _zigzag(value))
+    if isinstance(value, float):
+        return _pb_varint((3 << 3) | 1) + struct.pack('<d', value)
+    return _pb_field(1, str(value).encode('utf-8'))
+
+def _mvt_polygon_commands(polygons):
+    """
+    Encodes polygons (each a list of rings of integer tile coordinates, exterior first) as
+    MVT geometry commands. Exterior rings get a positive shoelace area in tile space (y down),
+    holes a negative one; rings that collapsed when snapped to the grid are dropped.
+    """
+    commands = []
+    cursor_x = cursor_y = 0
+    for rings in polygons:
+        for ring_idx, ring in enumerate(rings):
+            # Drop the closing point and consecutive duplicates left by snapping
+            points = [point for i, point in enumerate(ring[:-1]) if i == 0 or point != ring[i - 1]]
+            if len(points) > 1 and points[-1] == points[0]:
+                points.pop()
+            if len(points) < 3:
+                if ring_idx == 0:
+                    break  # Holes of a collapsed exterior go with it
+                continue
+            area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]))
+            if area == 0:
+                if ring_idx == 0:
+                    break
+                continue
+            if (area > 0) != (ring_idx == 0):
+                points.reverse()
+
+            x, y = points[0]
+            commands += [(1 << 3) | 1, _zigzag(x - cursor_x), _zigzag(y - cursor_y)]
+            commands.append(((len(points) - 1) << 3) | 2)
+            for (prev_x, prev_y), (x, y) in zip(points, points[1:]):
+                commands += [_zigzag(x - prev_x), _zigzag(y - prev_y)]
+            commands.append((1 << 3) | 7)
+            cursor_x, cursor_y = points[-1]
+    return commands
+
+def encode_mvt_tile(features, layer_name=MVT_LAYER_NAME, extent=MVT_EXTENT):
+    """
+    Encodes one MVT tile with a single polygon layer. `features` is a list of
+    (polygons, properties) in tile coordinates (see `_mvt_polygon_commands`).
+    Returns b'' when nothing is left to draw.
+    """
+    keys, values = {}, {}
+    encoded_features = []
+    for feature_id, (polygons, properties) in enumerate(features, start=1):
+        commands = _mvt_polygon_commands(polygons)
+        if not commands:
+            continue
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            value_key = (type(value).__name__, value)
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(value_key, len(values)))
+        encoded_features.append(
+            _pb_uint(1, feature_id)
+            + _pb_field(2, b''.join(_pb_varint(tag) for tag in tags))
+            + _pb_uint(3, 3)  # POLYGON
+            + _pb_field(4, b''.join(_pb_varint(command) for command in commands))
+        )
+    if not encoded_features:
+        return b''
+
+    layer = (
+        _pb_uint(15, 2)
+        + _pb_field(1, layer_name.encode('utf-8'))
+        + b''.join(_pb_field(2, feature) for feature in encoded_features)
+        + b''.join(_pb_field(3, key.encode('utf-8')) for key in keys)
+        + b''.join(_pb_field(4, _mvt_value(value)) for _, value in values)
+        + _pb_uint(5, extent)
+    )
+    return _pb_field(3, layer)
+
+def _mercator_tile_bounds(z, x, y):
+    """Web Mercator bounds (minx, miny, maxx, maxy) of XYZ tile z/x/y."""
+    tile_size = WEB_MERCATOR_WORLD_SIZE / 2 ** z
+    minx = -WEB_MERCATOR_WORLD_SIZE / 2 + x * tile_size
+    maxy = WEB_MERCATOR_WORLD_SIZE / 2 - y * tile_size
+    return minx, maxy - tile_size, minx + tile_size, maxy
+
+# Per-process state for `_encode_mvt_batch`: the zone geometries (Web Mercator) and properties
+_MVT_WORKER_STATE = {}
+
+def _init_mvt_worker(geometries_wkb, properties):
+    """Process pool initializer: receives the zones once per worker rather than once per task."""
+    _MVT_WORKER_STATE['geometries'] = shapely.from_wkb(np.array(geometries_wkb, dtype=object))
+    _MVT_WORKER_STATE['properties'] = properties
+
+def _encode_mvt_batch(task):
+    """Encodes a batch of tiles of one zoom level: task = (z, [(x, y, zone_indices), ...])."""
+    z, tiles = task
+    geometries = _MVT_WORKER_STATE['geometries']
+    properties = _MVT_WORKER_STATE['properties']
+    tile_size = WEB_MERCATOR_WORLD_SIZE / 2 ** z
+    scale = MVT_EXTENT / tile_size
+    margin = tile_size * MVT_BUFFER / MVT_EXTENT
+    tolerance = tile_size * MVT_SIMPLIFY_UNITS / MVT_EXTENT
+
+    encoded = []
+    for x, y, zone_idx in tiles:
+        minx, miny, maxx, maxy = _mercator_tile_bounds(z, x, y)
+        zone_idx = np.asarray(zone_idx)
+        clipped = shapely.clip_by_rect(
+            shapely.simplify(geometries[zone_idx], tolerance),
+            minx - margin, miny - margin, maxx + margin, maxy + margin
+        )
+        # Tile space: origin at the top-left corner, y down, snapped to the integer grid.
+        # Rounding can make edges cross; those geometries are snap-rounded instead, which
+        # nodes the crossings and drops the parts that collapse.
+        tile_space = shapely.transform(clipped, lambda coords: (coords - [minx, maxy]) * [scale, -scale])
+        in_tile = shapely.transform(tile_space, np.rint)
+        invalid = ~shapely.is_valid(in_tile)
+        if invalid.any():
+            in_tile[invalid] = shapely.set_precision(tile_space[invalid], 1)
+        features = []
+        for i, geometry in zip(zone_idx, in_tile):
+            if geometry.is_empty:
+                continue
+            parts = shapely.get_parts(geometry)
+            polygons = [
+                [[(int(px), int(py)) for px, py in ring.coords] for ring in (part.exterior, *part.interiors)]
+                for part in parts if part.geom_type == 'Polygon' and not part.is_empty
+            ]
+            if polygons:
+                features.append((polygons, properties[i]))
+        data = encode_mvt_tile(features)
+        if data:
+            encoded.append((f"{z}/{x}/{y}", data))
+    return encoded
+
+def build_vector_tiles(features):
+    """
+    Builds the MVT pyramid (MVT_MIN_ZOOM..MVT_MAX_ZOOM) of the zones. Only tiles that
+    contain a zone are produced. Returns {"z/x/y": tile bytes}.
+    """
+    geometries = np.array([shape(f['geometry']) for f in features], dtype=object)
+    geometries = shapely.transform(geometries, _bulk_transform(transformer_to_web_mercator))
+    properties = [
+        {key: f.get('properties', {}).get(key) for key in MVT_PROPERTIES}
+        for f in features
+    ]
+    bounds = shapely.bounds(geometries)
+
+    # Tiles each zone touches (with the buffer), grouped into batches of one zoom level
+    tasks = []
+    tile_count = 0
+    for z in range(MVT_MIN_ZOOM, MVT_MAX_ZOOM + 1):
+        tile_size = WEB_MERCATOR_WORLD_SIZE / 2 ** z
+        margin = tile_size * MVT_BUFFER / MVT_EXTENT
+        last = 2 ** z - 1
+        x0 = np.clip(np.floor((bounds[:, 0] - margin + WEB_MERCATOR_WORLD_SIZE / 2) / tile_size), 0, last).astype(int)
+        x1 = np.clip(np.floor((bounds[:, 2] + margin + WEB_MERCATOR_WORLD_SIZE / 2) / tile_size), 0, last).astype(int)
+        y0 = np.clip(np.floor((WEB_MERCATOR_WORLD_SIZE / 2 - bounds[:, 3] - margin) / tile_size), 0, last).astype(int)
+        y1 = np.clip(np.floor((WEB_MERCATOR_WORLD_SIZE / 2 - bounds[:, 1] + margin) / tile_size), 0, last).astype(int)
+        tiles = {}
+        for i in range(len(geometries)):
+            for x in range(x0[i], x1[i] + 1):
+                for y in range(y0[i], y1[i] + 1):
+                    tiles.setdefault((x, y), []).append(i)
+        tile_items = [(x, y, zone_idx) for (x, y), zone_idx in sorted(tiles.items())]
+        tile_count += len(tile_items)
+        for start in range(0, len(tile_items), MVT_TILES_PER_TASK):
+            tasks.append((z, tile_items[start:start + MVT_TILES_PER_TASK]))
+
+    started = time.perf_counter()
+    tiles = {}
+    if tile_count >= MVT_PROCESS_POOL_MIN_TILES and MVT_WORKERS > 1:
+        # Spawned (not forked) workers: the caller may have other threads running
+        with ProcessPoolExecutor(
+            max_workers=MVT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_mvt_worker,
+            initargs=(list(shapely.to_wkb(geometries)), properties)
+        ) as pool:
+            for encoded in pool.map(_encode_mvt_batch, tasks):
+                tiles.update(encoded)
+        mode = f"{MVT_WORKERS} processes"
+    else:
+        _init_mvt_worker(list(shapely.to_wkb(geometries)), properties)
+        try:
+            for task in tasks:
+                tiles.update(_encode_mvt_batch(task))
+        finally:
+            _MVT_WORKER_STATE.clear()
+        mode = "in-process"
+    print(f"Encoded {len(tiles)} of {tile_count} candidate vector tiles "
+          f"(z{MVT_MIN_ZOOM}-{MVT_MAX_ZOOM}) {mode} in {time.perf_counter() - started:.3f}s")
+    return tiles
+
+def save_vector_tiles(features):
+    """
+    Publishes the MVT pyramid of the zones to GCS, uploading only tiles whose content changed
+    since the last run and deleting tiles that no longer have zones. The per-tile MD5s are
+    kept in MVT_MANIFEST_PATH.
+    """
+    started = time.perf_counter()
+    tiles = build_vector_tiles(features)
+    checksums = {key: hashlib.md5(data).hexdigest() for key, data in tiles.items()}
+
+    manifest_blob = get_gcs_blob(GCS_BUCKET_NAME, MVT_MANIFEST_PATH)
+    previous = {}
+    try:
+        if manifest_blob.exists():
+            previous = json.loads(manifest_blob.download_as_text()).get('tiles', {})
+    except Exception as e:
+        print(f"Error loading vector tile manifest: {e}. Uploading all tiles.")
+    changed = [key for key, checksum in checksums.items() if previous.get(key) != checksum]
+    removed = [key for key in previous if key not in checksums]
+
+    def upload_tile(key):
+        z, x, y = key.split('/')
+        tile_blob = get_gcs_blob(GCS_BUCKET_NAME, MVT_TILE_PATH_TEMPLATE.format(z=z, x=x, y=y))
+        tile_blob.content_encoding = 'gzip'
+        tile_blob.upload_from_string(gzip.compress(tiles[key], mtime=0), content_type=MVT_CONTENT_TYPE)
+
+    def delete_tile(key):
+        z, x, y = key.split('/')
+        tile_blob = get_gcs_blob(GCS_BUCKET_NAME, MVT_TILE_PATH_TEMPLATE.format(z=z, x=x, y=y))
+        if tile_blob.exists():
+            tile_blob.delete()
+
+    if changed or removed:
+        with ThreadPoolExecutor(max_workers=MVT_UPLOAD_WORKERS) as executor:
+            # list() re-raises the first failure; the manifest is then left as it was
+            list(executor.map(upload_tile, changed))
+            list(executor.map(delete_tile, removed))
+        manifest_blob.upload_from_string(json.dumps({
+            'minzoom': MVT_MIN_ZOOM,
+            'maxzoom': MVT_MAX_ZOOM,
+            'layer': MVT_LAYER_NAME,
+            'tiles': checksums
+        }), content_type="application/json")
+    print(f"Vector tiles: {len(changed)} uploaded ({sum(len(tiles[key]) for key in changed)} bytes), "
+          f"{len(removed)} removed, {len(tiles) - len(changed)} unchanged, in {time.perf_counter() - started:.3f}s")
+
+# ======================================================================
+# --- HELPER FUNCTIONS (Swim zone queries) ---
+# ======================================================================
+
+class ZoneGrid:
+    """
+    Precomputed classification grid over the zones' extent, stored sparsely.
+
+    Only cells some zone touches are kept, as sorted cell keys (row * cols + col)
+    with a uint16 value each: BOUNDARY (needs an exact test) or 1 + the index of
+    the single zone that contains the whole cell. Every other cell is EMPTY, so
+    the footprint follows the zones' area rather than the extent, and a point
+    query is one binary search over the occupied cells.
+    """
+
+    EMPTY = 0
+    BOUNDARY = np.iinfo(np.uint16).max
+
+    def __init__(self, keys, values, origin_x, origin_y, cell_size, shape, zones_generation=None):
+        self.keys = keys
+        self.values_by_key = values
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.cell_size = cell_size
+        self.rows, self.cols = shape
+        self.zones_generation = zones_generation
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.values_by_key.nbytes
+
+    def describe(self):
+        """One-line summary of the grid's size and memory footprint."""
+        boundary = int((self.values_by_key == self.BOUNDARY).sum())
+        return (f"{len(self.keys)} occupied cells at {self.cell_size} deg "
+                f"({len(self.keys) - boundary} owned, {boundary} boundary), {self.nbytes / 1024:.1f} KiB")
+
+    @classmethod
+    def build(cls, geometries, cell_size=ZONE_GRID_CELL_DEGREES, zones_generation=None):
+        """Rasterizes the (prepared) zone geometries. Returns None if there are too many zones."""
+        if len(geometries) >= cls.BOUNDARY:
+            return None
+        started = time.perf_counter()
+        minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+        origin_x = np.floor(minx / cell_size) * cell_size
+        origin_y = np.floor(miny / cell_size) * cell_size
+        cols = max(int(np.ceil((maxx - origin_x) / cell_size)), 1)
+        rows = max(int(np.ceil((maxy - origin_y) / cell_size)), 1)
+
+        touched_keys, touched_values = [], []
+        for i, geometry in enumerate(geometries):
+            gminx, gminy, gmaxx, gmaxy = geometry.bounds
+            col_range = np.arange(int((gminx - origin_x) // cell_size), min(int((gmaxx - origin_x) // cell_size) + 1, cols))
+            row_range = np.arange(int((gminy - origin_y) // cell_size), min(int((gmaxy - origin_y) // cell_size) + 1, rows))
+            cell_cols, cell_rows = (a.ravel() for a in np.meshgrid(col_range, row_range))
+            cell_boxes = shapely.box(
+                origin_x + cell_cols * cell_size, origin_y + cell_rows * cell_size,
+                origin_x + (cell_cols + 1) * cell_size, origin_y + (cell_rows + 1) * cell_size
+            )
+            touched = shapely.intersects(geometry, cell_boxes)
+            inside = shapely.contains_properly(geometry, cell_boxes[touched])
+            touched_keys.append(cell_rows[touched].astype(np.int64) * cols + cell_cols[touched])
+            touched_values.append(np.where(inside, i + 1, cls.BOUNDARY).astype(np.uint16))
+
+        all_keys = np.concatenate(touched_keys) if touched_keys else np.empty(0, dtype=np.int64)
+        all_values = np.concatenate(touched_values) if touched_values else np.empty(0, dtype=np.uint16)
+        keys, first, counts = np.unique(all_keys, return_index=True, return_counts=True)
+        # A cell is owned by one zone only if that zone alone covers it entirely
+        values = np.where(counts == 1, all_values[first], cls.BOUNDARY).astype(np.uint16)
+
+        grid = cls(keys, values, origin_x, origin_y, cell_size, (rows, cols), zones_generation)
+        print(f"Zone grid built over {rows}x{cols} cells: {grid.describe()}, "
+              f"in {time.perf_counter() - started:.3f}s")
+        return grid
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Restores a grid written with `to_bytes`."""
+        with np.load(io.BytesIO(data)) as npz:
+            header = npz['header']
+            generation = int(npz['zones_generation']) if npz['zones_generation'] >= 0 else None
+            return cls(npz['keys'], npz['values'], float(header[0]), float(header[1]), float(header[2]),
+                       (int(header[3]), int(header[4])), generation)
+
+    def to_bytes(self):
+        """Serializes the grid as a compressed .npz."""
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            keys=self.keys,
+            values=self.values_by_key,
+            header=np.array([self.origin_x, self.origin_y, self.cell_size, self.rows, self.cols]),
+            zones_generation=np.int64(self.zones_generation if self.zones_generation is not None else -1)
+        )
+        return buffer.getvalue()
+
+    def value(self, longitude, latitude):
+        """Scalar version of `values`, without any array allocation."""
+        col = math.floor((longitude - self.origin_x) / self.cell_size)
+        row = math.floor((latitude - self.origin_y) / self.cell_size)
+        if not (0 <= col < self.cols and 0 <= row < self.rows):
+            return self.EMPTY
+        key = row * self.cols + col
+        position = int(self.keys.searchsorted(key))
+        if position < len(self.keys) and self.keys[position] == key:
+            return int(self.values_by_key[position])
+        return self.EMPTY
+
+    def values(self, longitudes, latitudes):
+        """Returns the cell value for every coordinate (EMPTY outside the occupied cells)."""
+        cols = np.floor((np.asarray(longitudes, dtype=float) - self.origin_x) / self.cell_size)
+        rows = np.floor((np.asarray(latitudes, dtype=float) - self.origin_y) / self.cell_size)
+        values = np.full(np.shape(cols), self.EMPTY, dtype=np.uint16)
+        in_grid = np.flatnonzero((cols >= 0) & (cols < self.cols) & (rows >= 0) & (rows < self.rows))
+        if len(in_grid) and len(self.keys):
+            keys = rows[in_grid].astype(np.int64) * self.cols + cols[in_grid].astype(np.int64)
+            positions = np.minimum(self.keys.searchsorted(keys), len(self.keys) - 1)
+            found = self.keys[positions] == keys
+            values[in_grid[found]] = self.values_by_key[positions[found]]
+        return values
+
+def save_zone_grid(features, zones_generation):
+    """Builds the lookup grid for freshly published zones and stores it next to the GeoJSON."""
+    geometries = np.array([shape(f['geometry']) for f in features], dtype=object)
+    shapely.prepare(geometries)
+    grid = ZoneGrid.build(geometries, zones_generation=zones_generation)
+    if grid is None:
+        print("Too many zones for a uint16 lookup grid. Skipping it.")
+        return
+    grid_blob = get_gcs_blob(GCS_BUCKET_NAME, ZONE_GRID_PATH)
+    grid_blob.upload_from_string(grid.to_bytes(), content_type="application/octet-stream")
+    print(f"Saved zone grid to gs://{GCS_BUCKET_NAME}/{ZONE_GRID_PATH}")
+
+class ZoneIndex:
+    """
+    STRtree over the prepared no-swim zone polygons.
+
+    Built once per instance from the published zones, so every point query is an
+    index lookup plus a `contains` test on the few zones whose envelope matches.
+    """
+
+    def __init__(self, features, generation=None, grid=None, geometries=None):
+        self.features = list(features)
+        self.generation = generation  # GCS generation of the zones file it was built from
+        if geometries is None:
+            geometries = [shape(f['geometry']) for f in self.features]
+        self.geometries = np.array(geometries, dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = STRtree(self.geometries)
+
+        # O(1) pre-classification; only BOUNDARY cells fall through to the exact test
+        if grid is None and self.features:
+            grid = ZoneGrid.build(self.geometries, zones_generation=generation)
+        self.grid = grid
+
+        # Metric copy (EPSG:2100) for nearest-zone / distance queries
+        self.geometries_greek_grid = shapely.transform(self.geometries, _bulk_transform(transformer_to_greek_grid))
+        self.tree_greek_grid = STRtree(self.geometries_greek_grid)
+
+    def feature(self, zone_idx):
+        """Returns a zone feature, filling in its GeoJSON geometry if it was loaded without one."""
+        feature = self.features[zone_idx]
+        if feature.get('geometry') is None:
+            feature['geometry'] = mapping(self.geometries[zone_idx])
+        return feature
+
+    def lookup(self, longitude, latitude):
+        """Returns the zone feature containing the point, or None."""
+        if self.grid is not None:
+            cell = self.grid.value(longitude, latitude)
+            if cell == ZoneGrid.EMPTY:
+                return None
+            if cell != ZoneGrid.BOUNDARY:
+                return self.feature(cell - 1)
+
+        candidates = self.tree.query(shapely.points(longitude, latitude))
+        if len(candidates):
+            hits = candidates[shapely.contains_xy(self.geometries[candidates], longitude, latitude)]
+            if len(hits):
+                return self.feature(hits.min())
+        return None
+
+    def classify_many(self, longitudes, latitudes):
+        """
+        Vectorized lookup: returns, for every coordinate, the index of the zone
+        containing it, or -1.
+        """
+        longitudes = np.asarray(longitudes, dtype=float)
+        latitudes = np.asarray(latitudes, dtype=float)
+        zone_idx = np.full(len(longitudes), len(self.features), dtype=np.int64)
+
+        # Grid pre-classification: only BOUNDARY cells need the exact test
+        exact_idx = np.arange(len(longitudes))
+        if self.grid is not None:
+            cells = self.grid.values(longitudes, latitudes)
+            owned = (cells != ZoneGrid.EMPTY) & (cells != ZoneGrid.BOUNDARY)
+            zone_idx[owned] = cells[owned].astype(np.int64) - 1
+            exact_idx = np.flatnonzero(cells == ZoneGrid.BOUNDARY)
+
+        input_idx, candidate_idx = self.tree.query(shapely.points(longitudes[exact_idx], latitudes[exact_idx]))
+        input_idx = exact_idx[input_idx]
+        inside = shapely.contains_xy(
+            self.geometries[candidate_idx], longitudes[input_idx], latitudes[input_idx]
+        )
+        # Same tie-break as `lookup`: the first zone in the collection wins
+        np.minimum.at(zone_idx, input_idx[inside], candidate_idx[inside])
+        zone_idx[zone_idx == len(self.features)] = -1
+        return zone_idx
+
+    def nearest(self, longitude, latitude, max_distance_meters=None):
+        """
+        Returns (zone feature, distance in meters) for the zone closest to the point,
+        or None if there is none within `max_distance_meters` (positive, if given). The distance
+        is 0 inside a zone.
+        """
+        x, y = transformer_to_greek_grid(longitude, latitude)
+        zone_idx, distances = self.tree_greek_grid.query_nearest(
+            shapely.points(x, y), max_distance=max_distance_meters, return_distance=True, all_matches=False
+        )
+        if not len(zone_idx):
+            return None
+        return self.feature(zone_idx[0]), float(distances[0])
+
+def parse_batch_coordinates(payload):
+    """
+    Extracts (longitudes, latitudes) arrays from a batch request body: a list of
+    [longitude, latitude] pairs, a GeoJSON MultiPoint, or a FeatureCollection of Points.
+    Raises ValueError for anything else.
+    """
+    if isinstance(payload, dict) and payload.get('type') == 'FeatureCollection':
+        pairs = []
+        for feature in payload.get('features', []):
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') != 'Point':
+                raise ValueError("FeatureCollection features must be Points.")
+            pairs.append(geometry.get('coordinates', [])[:2])
+    elif isinstance(payload, dict) and payload.get('type') == 'MultiPoint':
+        pairs = [c[:2] for c in payload.get('coordinates', [])]
+    elif isinstance(payload, list):
+        if not all(isinstance(c, list) for c in payload):
+            raise ValueError("Expected a [[longitude, latitude], ...] array of pairs.")
+        pairs = [c[:2] for c in payload]
+    else:
+        raise ValueError("Expected a [[longitude, latitude], ...] array, a MultiPoint or a FeatureCollection.")
+
+    if any(len(pair) != 2 for pair in pairs):
+        raise ValueError("Each coordinate needs a longitude and a latitude.")
+    coordinates = np.array(pairs, dtype=float).reshape(-1, 2)
+    if not np.isfinite(coordinates).all():
+        raise ValueError("Coordinates must be finite numbers.")
+    return coordinates[:, 0], coordinates[:, 1]
+
+class LookupCache:
+    """
+    Thread-safe LRU cache with TTL for point-in-zone results, keyed on quantized
+    coordinates and bound to one zone dataset generation.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_entries, ttl_seconds, precision):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.precision = precision
+        self.generation = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def quantize(self, longitude, latitude):
+        return (round(longitude, self.precision), round(latitude, self.precision))
+
+    def get(self, key, generation):
+        """Returns the cached value, or LookupCache._MISSING."""
+        with self._lock:
+            if generation != self.generation:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.generation = generation
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return self._MISSING
+
+    def put(self, key, value, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'precision': self.precision,
+                'generation': self.generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+_LOOKUP_CACHE = LookupCache(LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL_SECONDS, LOOKUP_CACHE_PRECISION)
+
+def cached_lookup(zone_index, longitude, latitude):
+    """ZoneIndex.lookup behind the quantized-coordinate LRU cache."""
+    key = _LOOKUP_CACHE.quantize(longitude, latitude)
+    zone = _LOOKUP_CACHE.get(key, zone_index.generation)
+    if zone is LookupCache._MISSING:
+        zone = zone_index.lookup(*key)
+        _LOOKUP_CACHE.put(key, zone, zone_index.generation)
+    return zone
+
+def load_zone_index():
+    """Downloads the published zones and builds a ZoneIndex tagged with the object's generation."""
+    started = time.perf_counter()
+    features, geometries, generation = load_published_zones(geojson_geometries=False)
+
+    # Reuse the published lookup grid if it was built from this exact generation
+    grid = None
+    try:
+        grid_blob = get_gcs_blob(GCS_BUCKET_NAME, ZONE_GRID_PATH)
+        if grid_blob.exists():
+            grid = ZoneGrid.from_bytes(grid_blob.download_as_bytes())
+            if grid.zones_generation != generation:
+                grid = None
+            else:
+                print(f"Loaded zone grid: {grid.describe()}")
+    except Exception as e:
+        print(f"Error loading zone grid: {e}. Building it locally.")
+        grid = None
+
+    zone_index = ZoneIndex(features, generation, grid, geometries)
+    print(f"Zone index built with {len(zone_index.features)} zones (generation {generation}) "
+          f"in {time.perf_counter() - started:.3f}s")
+    return zone_index
+
+def _refresh_zone_index():
+    """Background poll: rebuilds the index and swaps it in if the published zones changed."""
+    try:
+        blob = get_gcs_blob(GCS_BUCKET_NAME, OUTPUT_GEOJSON_PATH)
+        blob.reload()
+        if blob.generation != _ZONE_INDEX_CACHE['index'].generation:
+            print(f"Published zones changed (generation {blob.generation}). Rebuilding zone index.")
+            # A single reference assignment: requests see either the old or the new index
+            _ZONE_INDEX_CACHE['index'] = load_zone_index()
+    except Exception as e:
+        print(f"Zone index refresh failed: {e}. Keeping the current index.")
+    finally:
+        _ZONE_INDEX_REFRESH_LOCK.release()
+
+def get_zone_index():
+    """
+    Returns the ZoneIndex for the published zones. The first call builds it; afterwards
+    the zones file generation is polled in a background thread at most every
+    ZONE_INDEX_POLL_SECONDS, so requests never wait for a download or rebuild.
+    """
+    zone_index = _ZONE_INDEX_CACHE.get('index')
+    if zone_index is None:
+        with _ZONE_INDEX_LOAD_LOCK:
+            if 'index' not in _ZONE_INDEX_CACHE:
+                zone_index = load_zone_index()
+                # checked_at first: a request that sees the index skips the lock and reads it
+                _ZONE_INDEX_CACHE['checked_at'] = time.monotonic()
+                _ZONE_INDEX_CACHE['index'] = zone_index
+        return _ZONE_INDEX_CACHE['index']
+
+    if (time.monotonic() - _ZONE_INDEX_CACHE['checked_at'] >= ZONE_INDEX_POLL_SECONDS
+            and _ZONE_INDEX_REFRESH_LOCK.acquire(blocking=False)):
+        _ZONE_INDEX_CACHE['checked_at'] = time.monotonic()
+        threading.Thread(target=_refresh_zone_index, daemon=True).start()
+    return zone_index
+
+def describe_zone(feature):
+    """Builds the zone part of a check_swim_zone response."""
+    properties = feature.get('properties', {})
+    details = {
+        'zone_details': properties,
+        'zone_geometry': feature.get('geometry'),
+    }
+    if properties.get('Column1.compliance') is False:
+        details['compliance_status'] = 'NON_COMPLIANT'
+        details['compliance_warning'] = '⚠️ NON-COMPLIANT ZONE - Column1.compliance: false'
+    else:
+        details['compliance_status'] = 'COMPLIANT'
+    return details
+
 # ======================================================================
 # --- MAIN WORKFLOW FUNCTIONS ---
 # ======================================================================
 
-def sync_to_drive_internal():
-    """Internal function to handle KML conversion and Drive upload."""
+def load_drive_sync_state():
+    """Loads what was last published to Drive: {'geojson_generation', 'filename', 'md5'}."""
+    try:
+        state_blob = get_gcs_blob(GCS_BUCKET_NAME, DRIVE_SYNC_STATE_PATH)
+        if state_blob.exists():
+            return json.loads(state_blob.download_as_text())
+    except Exception as e:
+        print(f"Error loading Drive sync state: {e}")
+    return {}
+
+def save_drive_sync_state(state):
+    """Saves the Drive sync state (not fatal: the next sync just regenerates the KML)."""
+    try:
+        state_blob = get_gcs_blob(GCS_BUCKET_NAME, DRIVE_SYNC_STATE_PATH)
+        state_blob.upload_from_string(json.dumps(state), content_type="application/json")
+    except Exception as e:
+        print(f"Failed to save Drive sync state: {e}")
+
+def sync_to_drive_internal(geojson_data=None, geojson_generation=None):
+    """
+    Internal function to handle KML conversion and Drive upload.
+    Uses the FeatureCollection it is handed (e.g. the one check_for_changes just published);
+    only downloads the published zones from GCS when called without one. If the published
+    GeoJSON was already exported and the Drive file is intact, nothing is regenerated or uploaded.
+    """
     print("==== Starting GeoJSON to Drive sync ====")
+    # Per-region exports are fronted by a master KML of NetworkLinks
+    if DRIVE_EXPORT_BY_REGION:
+        export_format = "kml"
+    else:
+        export_format = "kmz" if DRIVE_EXPORT_TILED else DRIVE_EXPORT_FORMAT
+    filename = f"{DRIVE_EXPORT_BASENAME}.{export_format}"
+    state = load_drive_sync_state()
     
-    # 1. Download GeoJSON from GCS
-    print(f"Downloading GeoJSON from gs://{GCS_BUCKET_NAME}/{GEOJSON_PATH}")
-    geojson_data = get_geojson_from_gcs()
+    # 1. Download GeoJSON from GCS (unless the caller already has it in memory)
+    if geojson_data is None:
+        geojson_blob = get_gcs_blob(GCS_BUCKET_NAME, GEOJSON_PATH)
+        geojson_blob.reload()
+        if (
+            state.get('filename') == filename
+            and state.get('geojson_generation') == geojson_blob.generation
+        ):
+            with drive_service() as service:
+                drive_file = find_drive_file(service, filename, DRIVE_FOLDER_ID)
+                is_current = drive_file is not None and drive_file.get('md5Checksum') == state.get('md5')
+                if is_current:
+                    ensure_public_permission(service, drive_file['id'], filename, DRIVE_FOLDER_ID)
+            if is_current:
+                print(f"==== Drive already has generation {geojson_blob.generation} as '{filename}'. Nothing to sync. ====")
+                return {
+                    'success': True,
+                    'message': f'{export_format.upper()} file in Google Drive is up to date',
+                    'feature_count': state.get('feature_count'),
+                    'drive_file_id': drive_file['id'],
+                    'drive_link': drive_file.get('webViewLink', f"https://drive.google.com/file/d/{drive_file['id']}/view"),
+                    'filename': filename,
+                    'action': 'unchanged'
+                }
+        print(f"Downloading GeoJSON from gs://{GCS_BUCKET_NAME}/{GEOJSON_PATH}")
+        features, _, geojson_generation = load_published_zones()
+        geojson_data = {"type": "FeatureCollection", "features": features}
+    else:
+        print("Using in-memory GeoJSON from the analysis run")
     feature_count = len(geojson_data.get('features', []))
     print(f"Loaded {feature_count} features")
     
-    # 2. Convert to KML
-    print("Converting GeoJSON to KML...")
-    kml_content = geojson_to_kml(geojson_data)
-    print(f"KML generated, size: {len(kml_content)} bytes")
-    
-    # 3. Upload to Drive
-    filename = "wastewater_no_swim_zones.kml"
-    print(f"Uploading to Google Drive as '{filename}'...")
-    drive_result = upload_to_drive(kml_content, filename, DRIVE_FOLDER_ID)
+    load_kml_fragment_cache()
+    if DRIVE_EXPORT_BY_REGION:
+        # 2-3. One KMZ per region (only changed ones are uploaded) behind a master KML
+        print(f"Publishing per-region KMZ files behind '{filename}'...")
+        previous_regions = state.get('regions', {}) if state.get('filename') == filename else {}
+        drive_result = publish_regions_to_drive(geojson_data, previous_regions, filename)
+    else:
+        # 2. Convert to KML, streamed straight into the upload buffer (through a zip entry for KMZ)
+        print("Converting GeoJSON to KML...")
+        started = time.perf_counter()
+        file_content = io.BytesIO()
+        if export_format == "kmz":
+            kml_size = write_kmz(geojson_data, file_content, tiled=DRIVE_EXPORT_TILED)
+            mimetype = KMZ_MIMETYPE
+        else:
+            kml_size = write_kml(geojson_data, file_content)
+            mimetype = KML_MIMETYPE
+        print(
+            f"KML generated, size: {kml_size} bytes"
+            + (f" ({file_content.getbuffer().nbytes} bytes as KMZ)" if export_format == "kmz" else "")
+            + f", in {time.perf_counter() - started:.3f}s"
+        )
+        
+        # 3. Upload to Drive
+        print(f"Uploading to Google Drive as '{filename}'...")
+        drive_result = upload_to_drive(file_content, filename, DRIVE_FOLDER_ID, mimetype)
     
+    print(f"KML fragment cache: {_KML_FRAGMENT_CACHE.stats()}")
+    save_kml_fragment_cache()
     print(f"==== Sync complete: {drive_result['action']} ====")
     
+    new_state = {
+        'geojson_generation': geojson_generation,
+        'filename': filename,
+        'md5': drive_result['md5'],
+        'feature_count': feature_count
+    }
+    if DRIVE_EXPORT_BY_REGION:
+        new_state['regions'] = drive_result['regions']
+    if geojson_generation is not None and new_state != state:
+        save_drive_sync_state(new_state)
+    
     return {
         'success': True,
-        'message': f'Successfully {drive_result["action"]} KML file in Google Drive',
+        'message': (
+            f'{export_format.upper()} file in Google Drive is up to date' if drive_result['action'] == 'unchanged'
+            else f'Successfully {drive_result["action"]} {export_format.upper()} file in Google Drive'
+        ),
         'feature_count': feature_count,
         'drive_file_id': drive_result['file_id'],
         'drive_link': drive_result['web_link'],
-        'filename': filename
+        'filename': filename,
+        'action': drive_result['action']
     }
 
 
+def load_last_hash():
+    """
+    Returns the validators of the last processed payload: its content_hash together with
+    the ETag/Last-Modified it was served with, or {} if there is none. A hash file holding
+    just the hash (as written by older versions) gives a record without validators.
+    """
+    try:
+        hash_blob = get_gcs_blob(GCS_BUCKET_NAME, LAST_HASH_FILE_PATH)
+        if hash_blob.exists():
+            text = hash_blob.download_as_text()
+            try:
+                record = json.loads(text)
+            except ValueError:
+                record = None
+            return record if isinstance(record, dict) else {'content_hash': text.strip()}
+        print("No previous hash found. Proceeding with analysis.")
+    except Exception as e:
+        print(f"Error checking last hash: {e}. Proceeding with analysis.")
+    return {}
+
+def save_last_hash(validators):
+    """Records the hash and HTTP validators of the payload that was just processed."""
+    hash_blob = get_gcs_blob(GCS_BUCKET_NAME, LAST_HASH_FILE_PATH)
+    hash_blob.upload_from_string(json.dumps(validators), content_type="application/json")
+
+def load_previous_zones():
+    """Returns (manifest, existing_features) for incremental recomputation, or (None, None)."""
+    try:
+        manifest_blob = get_gcs_blob(GCS_BUCKET_NAME, PLANT_MANIFEST_PATH)
+        if manifest_blob.exists():
+            manifest = json.loads(manifest_blob.download_as_text())
+            return manifest, get_geojson_from_gcs().get('features', [])
+    except Exception as e:
+        print(f"Error loading per-plant manifest or previous zones: {e}. Recomputing all zones.")
+    return None, None
+
+def _timed(stage_timings, stage, func, *args, **kwargs):
+    """Runs func, recording its wall-clock time under `stage` (safe to call from worker threads)."""
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        stage_timings[stage] = time.perf_counter() - started
+
 @functions_framework.http
 def check_for_changes(request):
     """
@@ -356,49 +2262,70 @@ def check_for_changes(request):
     1. Fetches wastewater data and checks for changes.
     2. If changes exist, recalculates and updates the GeoJSON in GCS.
     3. Calls the KML sync process.
+    Independent I/O stages run concurrently; per-stage timings are logged at the end.
     """
     print("Function started: check_for_changes.")
-    
-    # --- Part 1: Fetch and Check Hash ---
+    started = time.perf_counter()
+    stage_timings = {}
+    # Leaving the with-block waits for any stage still in flight (e.g. the previous zones
+    # load when the boundaries fail to load), so nothing outlives the request
+    with ThreadPoolExecutor(max_workers=CHECK_STAGE_WORKERS) as executor:
+        response = _run_check_for_changes(executor, stage_timings)
+    elapsed = time.perf_counter() - started
+    print("Stage timings: " + ", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in stage_timings.items()))
+    print(f"Critical path: {elapsed:.3f}s wall clock for {sum(stage_timings.values()):.3f}s of stage time")
+    return response
+
+def _run_check_for_changes(executor, stage_timings):
+    """Body of check_for_changes; independent stages are submitted to `executor`."""
+    # --- Part 1: Fetch (conditionally) and Check Hash ---
+    # The hash is stored with the validators it was fetched under, so a single small read
+    # is all the conditional fetch waits for
+    validators = _timed(stage_timings, 'read_hash', load_last_hash)
+    last_hash = validators.get('content_hash')
+
     try:
-        response = requests.get(WASTEWATER_API_URL, timeout=30)
-        response.raise_for_status()
-        wastewater_data = response.json()
-        current_data_string = json.dumps(wastewater_data, sort_keys=True)
-        current_hash = hashlib.sha256(current_data_string.encode('utf-8')).hexdigest()
-    except requests.exceptions.RequestException as e:
+        wastewater_data, current_hash, new_validators = _timed(
+            stage_timings, 'api_fetch', fetch_wastewater_data, validators
+        )
+    except (requests.exceptions.RequestException, ValueError, ijson.JSONError) as e:
         print(f"Failed to fetch data from API: {e}")
         return ("Failed to fetch data.", 500)
-        
-    try:
-        hash_blob = get_gcs_blob(GCS_BUCKET_NAME, LAST_HASH_FILE_PATH)
-        if hash_blob.exists():
-            last_hash = hash_blob.download_as_text()
-            if current_hash == last_hash:
-                print("No changes detected in wastewater data. Checking Drive sync...")
-                # Even if no changes, we call the sync to ensure the KML file exists and is up-to-date
-                try:
-                    drive_result = sync_to_drive_internal()
-                    return (f"No data changes. KML Drive sync: {drive_result['action']}.", 200)
-                except Exception as e:
-                    return (f"No data changes. KML Drive sync failed: {str(e)}", 500)
-        else:
-            print("No previous hash found. Proceeding with analysis.")
-    except Exception as e:
-        print(f"Error checking last hash: {e}. Proceeding with analysis.")
+
+    if current_hash == last_hash:
+        print("No changes detected in wastewater data. Checking Drive sync...")
+        if new_validators != validators:
+            try:
+                save_last_hash(new_validators)
+            except Exception as e:
+                # Not fatal: the next run just fetches unconditionally
+                print(f"Failed to update hash file: {e}")
+        # Even if no changes, we call the sync to ensure the KML file exists and is up-to-date
+        try:
+            drive_result = _timed(stage_timings, 'drive_sync', sync_to_drive_internal)
+            return (f"No data changes. KML Drive sync: {drive_result['action']}.", 200)
+        except Exception as e:
+            return (f"No data changes. KML Drive sync failed: {str(e)}", 500)
         
     # --- Part 2: Load, Calculate, and Save GeoJSON ---
     
-    perifereies_geometries = load_perifereies_data(GCS_BUCKET_NAME, PERIFEREIES_GEOJSON_PATH)
-    if perifereies_geometries is None:
+    # The boundaries are only needed once a change is detected; they load alongside the
+    # previous zones
+    previous_zones_future = executor.submit(_timed, stage_timings, 'previous_zones', load_previous_zones)
+    land_mask = _timed(stage_timings, 'land_mask', load_land_mask, GCS_BUCKET_NAME, PERIFEREIES_GEOJSON_PATH)
+    if land_mask is None:
         return ("Failed to load perifereies data.", 500)
         
-    new_zones_features = calculate_new_zones(perifereies_geometries, wastewater_data)
+    manifest, existing_features = previous_zones_future.result()
+
+    new_zones_features, new_manifest = _timed(
+        stage_timings, 'calculate', calculate_zones_incremental,
+        land_mask, wastewater_data, manifest, existing_features
+    )
     
     if not new_zones_features:
         print("Analysis resulted in no new zones to save. Updating hash to prevent immediate re-run.")
-        hash_blob = get_gcs_blob(GCS_BUCKET_NAME, LAST_HASH_FILE_PATH)
-        hash_blob.upload_from_string(current_hash)
+        save_last_hash(new_validators)
         return ("Analysis complete. No zones saved.", 200)
         
     try:
@@ -410,28 +2337,178 @@ def check_for_changes(request):
         
         # Save GeoJSON
         output_blob = get_gcs_blob(GCS_BUCKET_NAME, OUTPUT_GEOJSON_PATH)
-        output_blob.upload_from_string(
-            json.dumps(new_zones_geojson),
-            content_type="application/geo+json"
+        _timed(
+            stage_timings, 'publish_geojson', upload_gzipped,
+            output_blob, json.dumps(new_zones_geojson), "application/geo+json"
         )
         print(f"Saved new GeoJSON to GCS: gs://{GCS_BUCKET_NAME}/{OUTPUT_GEOJSON_PATH}")
         
+        # Once the GeoJSON is published, the Drive export, the binary sidecar, the lookup grid
+        # and the vector tiles run alongside the manifest/hash bookkeeping below (readers fall
+        # back to the GeoJSON, or rebuild the grid themselves, if the sidecar or grid is missing
+        # or stale; tiles are simply retried on the next change)
+        drive_future = executor.submit(
+            _timed, stage_timings, 'drive_sync', sync_to_drive_internal, new_zones_geojson, output_blob.generation
+        )
+        derived_futures = {
+            'zones sidecar': executor.submit(
+                _timed, stage_timings, 'publish_sidecar', save_zones_sidecar, new_zones_features, output_blob.generation
+            ),
+            'zone grid': executor.submit(
+                _timed, stage_timings, 'publish_grid', save_zone_grid, new_zones_features, output_blob.generation
+            ),
+            'vector tiles': executor.submit(
+                _timed, stage_timings, 'publish_tiles', save_vector_tiles, new_zones_features
+            )
+        }
+        
+        # Update per-plant manifest (or remove it, so the next run recomputes everything)
+        manifest_blob = get_gcs_blob(GCS_BUCKET_NAME, PLANT_MANIFEST_PATH)
+        if new_manifest is not None:
+            manifest_blob.upload_from_string(json.dumps(new_manifest), content_type="application/json")
+            print("Per-plant manifest updated.")
+        elif manifest_blob.exists():
+            manifest_blob.delete()
+        
         # Update hash
-        hash_blob = get_gcs_blob(GCS_BUCKET_NAME, LAST_HASH_FILE_PATH)
-        hash_blob.upload_from_string(current_hash)
+        save_last_hash(new_validators)
         print("Hash file updated.")
         
+        for name, future in derived_futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to save {name}: {e}")
+        
     except Exception as e:
         print(f"Failed to save results to GCS: {e}")
         return ("Failed to save GeoJSON results.", 500)
         
     # --- Part 3: KML Conversion and Drive Upload ---
     try:
-        drive_result = sync_to_drive_internal()
+        drive_result = drive_future.result()
         
         return (f"Analysis complete. New GeoJSON saved. KML Drive sync: {drive_result['action']}.", 200)
         
     except Exception as e:
         print(f"KML Sync to Drive Failed: {e}")
         # Note: We return 200 here because the GeoJSON update (the primary goal) succeeded.
-        return (f"Analysis complete. GeoJSON saved. KML sync failed: {str(e)}", 200)
\ No newline at end of file
+        return (f"Analysis complete. GeoJSON saved. KML sync failed: {str(e)}", 200)
+
+
+@functions_framework.http
+def check_swim_zone(request):
+    """
+    Point-in-zone query entry point.
+    ?latitude=..&longitude=.. -> whether the point lies inside a no-swim zone,
+    with the zone's details and compliance status when it does.
+    """
+    try:
+        latitude = float(request.args.get('latitude'))
+        longitude = float(request.args.get('longitude'))
+        if not (math.isfinite(latitude) and math.isfinite(longitude)):
+            raise ValueError("non-finite coordinates")
+    except (TypeError, ValueError):
+        return (jsonify({'error': 'Numeric latitude and longitude query parameters are required.'}), 400)
+
+    try:
+        zone_index = get_zone_index()
+    except Exception as e:
+        print(f"Failed to load no-swim zones: {e}")
+        return (jsonify({'error': 'Failed to load no-swim zones.'}), 500)
+
+    zone = cached_lookup(zone_index, longitude, latitude)
+    result = {
+        'coordinates': {'latitude': latitude, 'longitude': longitude},
+        'in_no_swim_zone': zone is not None
+    }
+    if zone is not None:
+        result.update(describe_zone(zone))
+    return jsonify(result)
+
+
+@functions_framework.http
+def swim_zone_cache_stats(request):
+    """Reports the check_swim_zone lookup cache counters, for sizing it."""
+    return jsonify(_LOOKUP_CACHE.stats())
+
+
+@functions_framework.http
+def check_swim_zones_batch(request):
+    """
+    Batch point-in-zone entry point (POST).
+    The body is a [[longitude, latitude], ...] array, a GeoJSON MultiPoint or a
+    FeatureCollection of Points. The response holds one entry per input coordinate,
+    in order: the containing zone's code, or null. Large batches are streamed.
+    """
+    if request.method != 'POST':
+        return (jsonify({'error': 'Use POST with a JSON body.'}), 405)
+
+    try:
+        longitudes, latitudes = parse_batch_coordinates(request.get_json(force=True))
+    except Exception as e:
+        return (jsonify({'error': f'Invalid batch: {e}'}), 400)
+    if len(longitudes) > BATCH_MAX_POINTS:
+        return (jsonify({'error': f'Batches are limited to {BATCH_MAX_POINTS} coordinates.'}), 413)
+
+    try:
+        zone_index = get_zone_index()
+    except Exception as e:
+        print(f"Failed to load no-swim zones: {e}")
+        return (jsonify({'error': 'Failed to load no-swim zones.'}), 500)
+
+    zone_idx = zone_index.classify_many(longitudes, latitudes)
+    zone_codes = [zone.get('properties', {}).get('code') for zone in zone_index.features]
+    results = [zone_codes[i] if i >= 0 else None for i in zone_idx.tolist()]
+    hit_count = int((zone_idx >= 0).sum())
+
+    if len(results) <= BATCH_STREAM_THRESHOLD:
+        return jsonify({'count': len(results), 'hits': hit_count, 'results': results})
+
+    def generate():
+        yield f'{{"count": {len(results)}, "hits": {hit_count}, "results": ['
+        for start in range(0, len(results), BATCH_STREAM_CHUNK_SIZE):
+            chunk = json.dumps(results[start:start + BATCH_STREAM_CHUNK_SIZE])[1:-1]
+            yield (',' if start else '') + chunk
+        yield ']}'
+
+    return Response(generate(), mimetype='application/json')
+
+
+@functions_framework.http
+def nearest_swim_zone(request):
+    """
+    Nearest no-swim zone entry point.
+    ?latitude=..&longitude=..[&max_distance=meters] -> the closest zone and the
+    distance to it in meters (EPSG:2100), or found=false beyond max_distance.
+    """
+    try:
+        latitude = float(request.args.get('latitude'))
+        longitude = float(request.args.get('longitude'))
+        if not (math.isfinite(latitude) and math.isfinite(longitude)):
+            raise ValueError("non-finite coordinates")
+        max_distance = request.args.get('max_distance')
+        max_distance = float(max_distance) if max_distance is not None else None
+        if max_distance is not None and not (math.isfinite(max_distance) and max_distance > 0):
+            raise ValueError("max_distance must be a positive number of meters")
+    except (TypeError, ValueError):
+        return (jsonify({'error': 'Numeric latitude and longitude (and optional max_distance) query parameters are required.'}), 400)
+
+    try:
+        zone_index = get_zone_index()
+    except Exception as e:
+        print(f"Failed to load no-swim zones: {e}")
+        return (jsonify({'error': 'Failed to load no-swim zones.'}), 500)
+
+    nearest = zone_index.nearest(longitude, latitude, max_distance)
+    result = {
+        'coordinates': {'latitude': latitude, 'longitude': longitude},
+        'max_distance_meters': max_distance,
+        'found': nearest is not None
+    }
+    if nearest is not None:
+        zone, distance = nearest
+        result['distance_meters'] = round(distance, 1)
+        result['in_no_swim_zone'] = distance == 0
+        result.update(describe_zone(zone))
+    return jsonify(result)
\ No newline at end of file